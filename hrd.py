@@ -1,14 +1,56 @@
 import argparse
-from queue import PriorityQueue
+import heapq
+import importlib
+import json
+import os
+import time
+from itertools import count
 
+# The classic board. set_geometry changes the board size and the goal position
+# of the 2x2 piece, and rebuilds every table derived from them.
 WIDTH, HEIGHT = 4, 5
+GOAL_ROW, GOAL_COL = 3, 1
 
-def create_grid_from_file(filename):
+# Packed board encoding: a board is a single int in which every cell owns a
+# CELL_BITS wide field holding one of the piece codes below. Cell (i, j) lives
+# at bit offset CELL_BITS * (i * WIDTH + j).
+EMPTY, SINGLE, GOAL, UP, DOWN, LEFT, RIGHT = range(7)
+SYMBOLS = '.21^v<>'
+CODES = {ch: code for code, ch in enumerate(SYMBOLS)}
+CELL_BITS = 3
+CELL_MASK = (1 << CELL_BITS) - 1
+
+def read_boards(filename):
+    """Return the grids of a file holding boards one after another, separated by blank lines,
+    and the goal position its '# goal' line names, or None.
+
+    Lines starting with '#' are comments, except '# goal ROW COL', which places
+    the top left cell of the 2x2 piece's goal position.
+    """
+    boards = [[]]
+    goal = None
     with open(filename) as f:
-        grid = []
         for line in f:
-            grid.append(list(line.strip()))
-        return grid
+            if line.startswith('#'):
+                words = line[1:].split()
+                if words[:1] == ['goal']:
+                    goal = parse_cell(' '.join(words[1:]))
+            elif line.strip():
+                boards[-1].append(list(line.strip()))
+            elif boards[-1]:
+                boards.append([])
+    return [grid for grid in boards if grid], goal
+
+def read_puzzle(filename):
+    """Return the grid of the puzzle file <filename> and the goal position its header names, or None.
+
+    The file is read as by read_boards; blank lines are ignored.
+    """
+    boards, goal = read_boards(filename)
+    return [row for grid in boards for row in grid], goal
+
+def create_grid_from_file(filename):
+    return read_puzzle(filename)[0]
 
 def display_grid(grid):
     s = ''
@@ -159,64 +201,1147 @@ def get_successors(grid):
     return get_vertical_successors(grid) + get_horizontal_successors(grid) + get_point_successors(grid)
 
 def is_goal(grid):
-    return grid[3][1] == '1' and grid[3][2] == '1' and grid[4][1] == '1' and grid[4][2] == '1'
+    return (grid[GOAL_ROW][GOAL_COL] == '1' and grid[GOAL_ROW][GOAL_COL + 1] == '1'
+            and grid[GOAL_ROW + 1][GOAL_COL] == '1' and grid[GOAL_ROW + 1][GOAL_COL + 1] == '1')
 
 def get_manhattan_distance(grid):
     for i in range(HEIGHT):
         for j in range(WIDTH):
             if grid[i][j] == '1':
-                return abs(i - 3) + abs(j - 1)
+                return abs(i - GOAL_ROW) + abs(j - GOAL_COL)
+
+def _shift(i, j):
+    return CELL_BITS * (i * WIDTH + j)
+
+def _put(code, i, j):
+    return code << _shift(i, j)
+
+def _code_at(state, i, j):
+    return (state >> _shift(i, j)) & CELL_MASK
+
+def encode_grid(grid):
+    """Pack a list-of-lists grid into a single int."""
+    state = 0
+    for i in range(HEIGHT):
+        for j in range(WIDTH):
+            state |= _put(CODES[grid[i][j]], i, j)
+    return state
+
+def decode_state(state):
+    """Rebuild the list-of-lists grid of a packed state."""
+    return [[SYMBOLS[_code_at(state, i, j)] for j in range(WIDTH)] for i in range(HEIGHT)]
+
+def display_state(state):
+    return display_grid(decode_state(state))
+
+class KeyView:
+    """Read-only sequence over <count> big-endian keys of <key_bytes> each in a buffer, for bisect.
+
+    Tables on disk store canonical keys STATE_BYTES wide, sorted, and look them
+    up by binary search over a memory map.
+    """
+
+    def __init__(self, buffer, offset, count, key_bytes):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+        self._key_bytes = key_bytes
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        start = self._offset + index * self._key_bytes
+        return self._buffer[start:start + self._key_bytes]
+
+def validate_grid(grid):
+    """Raise ValueError unless <grid> is a board of whole pieces with one 2x2 goal block."""
+    if len(grid) != HEIGHT or any(len(row) != WIDTH for row in grid):
+        raise ValueError(f"the board is not {HEIGHT} rows of {WIDTH} cells")
+    goal = []
+    for i in range(HEIGHT):
+        for j in range(WIDTH):
+            ch = grid[i][j]
+            if ch not in CODES:
+                raise ValueError(f"unknown piece {ch!r} at ({i}, {j})")
+            if ch == '^' and (i + 1 == HEIGHT or grid[i + 1][j] != 'v'):
+                raise ValueError(f"'^' at ({i}, {j}) has no 'v' below it")
+            if ch == 'v' and (i == 0 or grid[i - 1][j] != '^'):
+                raise ValueError(f"'v' at ({i}, {j}) has no '^' above it")
+            if ch == '<' and (j + 1 == WIDTH or grid[i][j + 1] != '>'):
+                raise ValueError(f"'<' at ({i}, {j}) has no '>' to its right")
+            if ch == '>' and (j == 0 or grid[i][j - 1] != '<'):
+                raise ValueError(f"'>' at ({i}, {j}) has no '<' to its left")
+            if ch == '1':
+                goal.append((i, j))
+    if len(goal) != 4 or [(i - goal[0][0], j - goal[0][1]) for i, j in goal] != [(0, 0), (0, 1), (1, 0), (1, 1)]:
+        raise ValueError("the '1' cells do not form a single 2x2 block")
+
+def use_board(grid, goal=None):
+    """Play on the board size of <grid> with the 2x2 piece's goal at <goal>, and validate <grid>.
+
+    <goal> is a (row, column) pair, or None for the default goal position.
+    Raises ValueError for a goal off the board or a malformed grid.
+    """
+    if grid:
+        set_geometry(len(grid[0]), len(grid), *(goal or (None, None)))
+    validate_grid(grid)
+
+def load_puzzle(filename, goal=None):
+    """Return the validated grid of the puzzle file <filename>, after playing on its board.
+
+    <goal> overrides the goal position named by the file's '# goal' line.
+    """
+    grid, file_goal = read_puzzle(filename)
+    use_board(grid, goal or file_goal)
+    return grid
+
+def _cells_with_code(state, code):
+    """Return a mask with the lowest bit of every field of <state> equal to <code> set."""
+    x = state ^ (code * LOW_BITS)
+    return ~(x | x >> 1 | x >> 2) & LOW_BITS
+
+# Every piece shape as (row offset, column offset, code) cells from its top left corner.
+PIECE_SHAPES = {
+    SINGLE: ((0, 0, SINGLE),),
+    UP: ((0, 0, UP), (1, 0, DOWN)),
+    LEFT: ((0, 0, LEFT), (0, 1, RIGHT)),
+    GOAL: ((0, 0, GOAL), (0, 1, GOAL), (1, 0, GOAL), (1, 1, GOAL)),
+}
+
+def _build_move_table():
+    """Precompute every one-cell slide of every piece on the board.
+
+    A slide is legal when the fields it touches hold the piece and empty cells,
+    i.e. state & mask == bits, and it is applied as state ^ delta. Each slide is
+    filed under the first cell it moves into, which must be empty, and under the
+    piece cell next to that one, whose code selects the candidates to test:
+    table[blank bit] is a list of (neighbour shift, {neighbour code: [(mask, bits, delta)]}).
+    """
+    table = {}
+    for cells in PIECE_SHAPES.values():
+        for i in range(HEIGHT):
+            for j in range(WIDTH):
+                before = {(i + di, j + dj): code for di, dj, code in cells}
+                if not all(0 <= r < HEIGHT and 0 <= c < WIDTH for r, c in before):
+                    continue
+                for di, dj in ((-1, 0), (1, 0), (0, -1), (0, 1)):
+                    after = {(r + di, c + dj): code for (r, c), code in before.items()}
+                    if not all(0 <= r < HEIGHT and 0 <= c < WIDTH for r, c in after):
+                        continue
+                    mask = sum(_put(CELL_MASK, r, c) for r, c in set(before) | set(after))
+                    bits = sum(_put(code, r, c) for (r, c), code in before.items())
+                    delta = bits ^ sum(_put(code, r, c) for (r, c), code in after.items())
+                    r, c = min(cell for cell in after if cell not in before)
+                    entries = table.setdefault(1 << _shift(r, c), {})
+                    by_code = entries.setdefault(_shift(r - di, c - dj), {})
+                    by_code.setdefault(before[(r - di, c - dj)], []).append((mask, bits, delta))
+    return {blank: list(entries.items()) for blank, entries in table.items()}
+
+def get_successors_packed(state):
+    """Return every state one slide away from <state>.
+
+    The empty cells are found with a few whole-board bit operations, and only the
+    precomputed slides into those cells are tested.
+    """
+    successors = []
+    blanks = _cells_with_code(state, EMPTY)
+    while blanks:
+        blank = blanks & -blanks
+        blanks ^= blank
+        for shift, by_code in _MOVES[blank]:
+            moves = by_code.get((state >> shift) & CELL_MASK)
+            if moves:
+                for mask, bits, delta in moves:
+                    if state & mask == bits:
+                        successors.append(state ^ delta)
+    return successors
+
+def _slides_by_piece():
+    """Regroup _MOVES as {bits: [(mask, bits, delta)]}, the slides of the piece whose fields hold <bits>."""
+    table = {}
+    for entries in _MOVES.values():
+        for _, by_code in entries:
+            for moves in by_code.values():
+                for move in moves:
+                    table.setdefault(move[1], []).append(move)
+    return table
+
+def _nonzero_fields(x):
+    """Return a mask with the lowest bit of every non-zero field of <x> set."""
+    return (x | x >> 1 | x >> 2) & LOW_BITS
+
+def _piece_moves(state, parent=None):
+    """Return {state one piece move from <state>: the state one slide before it}.
+
+    Each piece is slid breadth-first through the empty cells, so the links give
+    the fewest slides a piece move takes. When <state> was reached from
+    <parent>, the piece that moved is left alone: anywhere it could go from here
+    it could have gone in that one move.
+    """
+    moved = 0 if parent is None else _nonzero_fields(state ^ parent)
+    links = {state: None}
+    todo = []
+    blanks = _cells_with_code(state, EMPTY)
+    while blanks:
+        blank = blanks & -blanks
+        blanks ^= blank
+        for shift, by_code in _MOVES[blank]:
+            moves = by_code.get((state >> shift) & CELL_MASK)
+            if moves:
+                for mask, bits, delta in moves:
+                    if state & mask == bits and not moved & _nonzero_fields(bits) and state ^ delta not in links:
+                        links[state ^ delta] = state
+                        todo.append((state ^ delta, bits ^ delta))
+    # todo grows while it is walked, which makes the walk breadth-first.
+    for curr, piece in todo:
+        for mask, bits, delta in _PIECE_SLIDES.get(piece, ()):
+            if curr & mask == bits and curr ^ delta not in links:
+                links[curr ^ delta] = curr
+                todo.append((curr ^ delta, bits ^ delta))
+    del links[state]
+    return links
+
+def get_macro_successors_packed(state, parent=None):
+    """Return every state one piece move away from <state>, leaving alone the piece moved from <parent>.
+
+    A piece move slides one piece any number of cells, around corners too; it
+    is how moves are counted in the usual statement of the puzzle.
+    """
+    return list(_piece_moves(state, parent))
+
+def expand_macro_path(path):
+    """Return the path of single slides that makes the piece moves of <path>."""
+    slides = path[:1]
+    for state, successor in zip(path, path[1:]):
+        links = _piece_moves(state)
+        steps = [successor]
+        while links[steps[-1]] != state:
+            steps.append(links[steps[-1]])
+        slides.extend(reversed(steps))
+    return slides
+
+def is_goal_packed(state):
+    return state & GOAL_MASK == GOAL_BITS
 
-def run_dfs(grid, output_file):
+def get_manhattan_distance_packed(state):
+    mask = _cells_with_code(state, GOAL)
+    return _GOAL_DISTANCE[mask & -mask]
+
+_MIRRORED_CODE = {LEFT: RIGHT, RIGHT: LEFT}
+# Widest board whose rows are reflected by table lookup; the table has 2 ** (3 * width) entries.
+MIRROR_TABLE_WIDTH = 6
+
+def _mirror_row(row):
+    mirrored = 0
+    for j in range(WIDTH):
+        code = (row >> (CELL_BITS * j)) & CELL_MASK
+        mirrored |= _MIRRORED_CODE.get(code, code) << (CELL_BITS * (WIDTH - 1 - j))
+    return mirrored
+
+def set_geometry(width, height, goal_row=None, goal_col=None):
+    """Play on a <width> by <height> board with the 2x2 piece's goal at <goal_row, goal_col>.
+
+    The goal defaults to the middle of the bottom two rows. Every table derived
+    from the geometry is rebuilt when it changes. Spawned worker processes
+    start on the classic board, so searches running on them hand geometry()
+    over. Raises ValueError for a goal off the board.
+    """
+    global WIDTH, HEIGHT, GOAL_ROW, GOAL_COL, CELLS, LOW_BITS, STATE_BYTES, GOAL_MASK, GOAL_BITS
+    global _MOVES, _PIECE_SLIDES, _GOAL_DISTANCE, ROW_BITS, ROW_MASK, _MIRROR_ROW, SYMMETRIC
+    goal_row = height - 2 if goal_row is None else goal_row
+    goal_col = (width - 2) // 2 if goal_col is None else goal_col
+    if not (0 <= goal_row <= height - 2 and 0 <= goal_col <= width - 2):
+        raise ValueError(f"the goal ({goal_row}, {goal_col}) does not fit a {width}x{height} board")
+    if (width, height, goal_row, goal_col) == geometry() and '_MOVES' in globals():
+        return
+    WIDTH, HEIGHT, GOAL_ROW, GOAL_COL = width, height, goal_row, goal_col
+    CELLS = WIDTH * HEIGHT
+    LOW_BITS = sum(1 << (CELL_BITS * k) for k in range(CELLS))
+    STATE_BYTES = (CELLS * CELL_BITS + 7) // 8
+    GOAL_MASK = sum(_put(CELL_MASK, GOAL_ROW + di, GOAL_COL + dj) for di in (0, 1) for dj in (0, 1))
+    GOAL_BITS = sum(_put(GOAL, GOAL_ROW + di, GOAL_COL + dj) for di in (0, 1) for dj in (0, 1))
+    _MOVES = _build_move_table()
+    _PIECE_SLIDES = _slides_by_piece()
+    # Manhattan distance to the goal position keyed by the lowest set bit of the
+    # goal-piece mask, i.e. by the top left corner of the 2x2 piece.
+    _GOAL_DISTANCE = {1 << _shift(i, j): abs(i - GOAL_ROW) + abs(j - GOAL_COL)
+                      for i in range(HEIGHT) for j in range(WIDTH)}
+    ROW_BITS = CELL_BITS * WIDTH
+    ROW_MASK = (1 << ROW_BITS) - 1
+    # Left/right reflection of every possible packed row, on boards narrow enough.
+    _MIRROR_ROW = [_mirror_row(row) for row in range(1 << ROW_BITS)] if WIDTH <= MIRROR_TABLE_WIDTH else None
+    # Reflecting a board only preserves solution lengths when the goal region is
+    # its own mirror image, as columns 1-2 of the classic 4-wide board are.
+    SYMMETRIC = GOAL_COL == WIDTH - 2 - GOAL_COL
+
+def geometry():
+    """Return (width, height, goal row, goal column), the arguments of set_geometry."""
+    return WIDTH, HEIGHT, GOAL_ROW, GOAL_COL
+
+set_geometry(WIDTH, HEIGHT, GOAL_ROW, GOAL_COL)
+
+def mirror_state(state):
+    """Return the left/right reflection of a packed state."""
+    mirrored = 0
+    if _MIRROR_ROW is None:
+        for i in range(HEIGHT):
+            shift = ROW_BITS * i
+            mirrored |= _mirror_row((state >> shift) & ROW_MASK) << shift
+        return mirrored
+    for i in range(HEIGHT):
+        shift = ROW_BITS * i
+        mirrored |= _MIRROR_ROW[(state >> shift) & ROW_MASK] << shift
+    return mirrored
+
+def canonical_key(state):
+    """Return the key shared by <state> and its mirror image, for duplicate detection."""
+    if not SYMMETRIC:
+        return state
+    mirrored = mirror_state(state)
+    return mirrored if mirrored < state else state
+
+def piece_counts(state):
+    """Return how many single, vertical and horizontal pieces <state> holds, keyed by their top left code."""
+    return {code: _cells_with_code(state, code).bit_count() for code in (SINGLE, UP, LEFT)}
+
+def enumerate_goal_states(counts):
+    """Return every packed goal state holding exactly the pieces in <counts>.
+
+    <counts> is shaped like the result of piece_counts; all remaining cells are empty.
+    """
+    return list(iter_goal_states(counts))
+
+def iter_goal_states(counts):
+    """Yield the states of enumerate_goal_states one at a time."""
+    goal_cells = {GOAL_ROW * WIDTH + GOAL_COL, GOAL_ROW * WIDTH + GOAL_COL + 1,
+                  (GOAL_ROW + 1) * WIDTH + GOAL_COL, (GOAL_ROW + 1) * WIDTH + GOAL_COL + 1}
+    occupied = [k in goal_cells for k in range(CELLS)]
+    remaining = dict(counts)
+    blanks = CELLS - 4 - remaining[SINGLE] - 2 * remaining[UP] - 2 * remaining[LEFT]
+
+    def place(k, state, blanks):
+        while k < CELLS and occupied[k]:
+            k += 1
+        if k == CELLS:
+            yield state
+            return
+        i, j = divmod(k, WIDTH)
+        if blanks:
+            yield from place(k + 1, state, blanks - 1)
+        if remaining[SINGLE]:
+            remaining[SINGLE] -= 1
+            yield from place(k + 1, state | _put(SINGLE, i, j), blanks)
+            remaining[SINGLE] += 1
+        if remaining[UP] and i + 1 < HEIGHT and not occupied[k + WIDTH]:
+            remaining[UP] -= 1
+            occupied[k + WIDTH] = True
+            yield from place(k + 1, state | _put(UP, i, j) | _put(DOWN, i + 1, j), blanks)
+            occupied[k + WIDTH] = False
+            remaining[UP] += 1
+        if remaining[LEFT] and j + 1 < WIDTH and not occupied[k + 1]:
+            remaining[LEFT] -= 1
+            occupied[k + 1] = True
+            yield from place(k + 2, state | _put(LEFT, i, j) | _put(RIGHT, i, j + 1), blanks)
+            occupied[k + 1] = False
+            remaining[LEFT] += 1
+
+    if blanks >= 0:
+        yield from place(0, GOAL_BITS, blanks)
+
+def check_geometry(filename, board, key_bytes=None):
+    """Raise ValueError unless <board>, the geometry() the file <filename> was made for, is the one in play.
+
+    <key_bytes>, when given, is the width of the states stored in the file.
+    """
+    if tuple(board) != geometry() or key_bytes not in (None, STATE_BYTES):
+        width, height, goal_row, goal_col = board
+        raise ValueError(f"{filename} was built for a {width}x{height} board "
+                         f"with the goal at ({goal_row}, {goal_col})")
+
+HEURISTICS = ['manhattan', 'pdb']
+
+# Tables this process has opened, by (class, file name, geometry()), with the
+# (inode, mtime, size) of the file they were opened from. Later searches reuse
+# a table, its memory map and its memos while the file is unchanged.
+_OPEN_TABLES = {}
+
+def open_table(opener, filename):
+    """Return <opener>(<filename>), reusing the one this process opened before for the same file and geometry.
+
+    <opener> is a class with a close() method, such as hrd_pdb.PatternDatabase.
+    A table whose file has changed since is closed and opened again.
+    """
+    info = os.stat(filename)
+    identity = (info.st_ino, info.st_mtime_ns, info.st_size)
+    key = (opener, os.path.abspath(filename), geometry())
+    opened = _OPEN_TABLES.get(key)
+    if opened is not None and opened[0] == identity:
+        return opened[1]
+    table = opener(filename)
+    if opened is not None:
+        opened[1].close()
+    _OPEN_TABLES[key] = (identity, table)
+    return table
+
+def close_tables():
+    """Close every table open_table has opened."""
+    for _, table in _OPEN_TABLES.values():
+        table.close()
+    _OPEN_TABLES.clear()
+
+def load_heuristic(name, start, pdb_file=None):
+    """Return the heuristic function called <name> for searches starting at <start>.
+
+    A pattern database stays open for later searches; see open_table.
+    """
+    if name == 'manhattan':
+        return get_manhattan_distance_packed
+    if name == 'pdb':
+        from hrd_pdb import PatternDatabase
+        database = open_table(PatternDatabase, pdb_file)
+        database.check(start)
+        return database.heuristic
+    raise ValueError(f"unknown heuristic {name!r}")
+
+class DepthLimitReached(Exception):
+    """Raised by a depth-limited search that found no path within its limit, though one may lie beyond it."""
+
+class MemoryBudgetExceeded(Exception):
+    """Raised from a search hook once the process has outgrown its memory budget.
+
+    A search that can be carried on from disk sets <closed>, the (canonical key,
+    g) pairs of the states it expanded, and <frontier>, the (g, state) pairs it
+    left open, before letting the exception through.
+    """
+
+    closed = frontier = None
+
+class SearchStats:
+    """Counters a search fills in when it is handed one.
+
+    <hook>, when given, is called as hook(state, expanded) after every <every>
+    expansions. With <timing> the search also splits its wall time between
+    successor generation, the heuristic and everything else; the timers wrap
+    those calls, so they slow the search down and are off by default.
+    """
+
+    def __init__(self, hook=None, every=1, timing=False):
+        self.hook = hook
+        self.every = every
+        self.timing = timing
+        self.expanded = 0
+        self.generated = 0
+        self.duplicates = 0
+        self.peak_frontier = 0
+        self.seconds = 0.0
+        # [f, expansions so far] each time the f-value being searched rises; for
+        # awastar, [weight, expansions so far] as each pass starts
+        self.f_progression = []
+        # the proven ratio of the solution length to the optimal one, for anytime searches
+        self.suboptimality = None
+        # the length in piece moves of a solution searched for with macro moves
+        self.piece_moves = None
+        self.timings = {'successors': 0.0, 'heuristic': 0.0, 'bookkeeping': 0.0} if timing else None
+
+    def add(self, expanded, generated, duplicates=0, peak_frontier=0, seconds=0.0):
+        self.expanded += expanded
+        self.generated += generated
+        self.duplicates += duplicates
+        self.peak_frontier = max(self.peak_frontier, peak_frontier)
+        self.seconds += seconds
+        if self.timings is not None:
+            self.timings['bookkeeping'] = self.seconds - self.timings['successors'] - self.timings['heuristic']
+
+    def timed(self, function, part):
+        """Return <function>, wrapped to add its running time to timings[<part>] when timing."""
+        if self.timings is None:
+            return function
+        timings = self.timings
+        clock = time.perf_counter
+
+        def timed_function(*args):
+            began = clock()
+            try:
+                return function(*args)
+            finally:
+                timings[part] += clock() - began
+        return timed_function
+
+    def as_dict(self):
+        fields = dict(vars(self))
+        for name in ('hook', 'every', 'timing'):
+            del fields[name]
+        if fields['timings'] is None:
+            del fields['timings']
+        return fields
+
+def _instrument(stats, h=None, successors=get_successors_packed):
+    """Return (successor function, heuristic, hook, every) for a search reporting to <stats>."""
+    if stats is None:
+        return successors, h, None, 1
+    return (stats.timed(successors, 'successors'), h and stats.timed(h, 'heuristic'),
+            stats.hook, stats.every)
+
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30}
+
+def parse_cell(text):
+    """Return the (row, column) of a cell written as 'ROW COL' or 'ROW,COL'."""
+    try:
+        row, col = map(int, text.replace(',', ' ').split())
+    except ValueError:
+        raise ValueError(f"{text!r} is not a cell written as 'ROW COL' or 'ROW,COL'") from None
+    return row, col
+
+def parse_size(text):
+    """Return the number of bytes in a size such as 4096, 512K, 64M or 2G."""
+    text = text.strip().upper().rstrip('B')
+    unit = text[-1:] if text[-1:] in _UNITS else ''
+    return int(float(text[:len(text) - len(unit)]) * _UNITS[unit])
+
+def write_solution(path, output_file):
+    """Write every packed state of <path> to <output_file>, one grid per block."""
     with open(output_file, 'w') as f:
-        path = []
-        stack = [(grid, path)]
-        seen = set()
-        while len(stack) > 0:
-            curr, path = stack.pop()
-            if display_grid(curr) in seen:
+        for state in path:
+            f.write(display_state(state) + '\n')
+
+def reconstruct_path(parents, state):
+    """Follow the predecessor map <parents> from <state> back to the start state.
+
+    <parents> maps the canonical key of every expanded state to the state it was
+    generated from, so the path consists of the states actually visited.
+    """
+    path = follow_links(parents, state)
+    path.reverse()
+    return path
+
+def follow_links(links, state):
+    """Return <state> followed by the chain of states <links> leads to from it."""
+    chain = []
+    while state is not None:
+        chain.append(state)
+        state = links[canonical_key(state)]
+    return chain
+
+def follow_mirrored_links(link, state):
+    """Return <state> followed by the chain of states <link> leads to from it.
+
+    link(state) returns the state recorded under the canonical key of <state>
+    and the state linked to it, or None at the end of the chain. The link is
+    adjacent to the recorded state, so it is reflected whenever the chain
+    reached the other mirror image.
+    """
+    chain = [state]
+    while True:
+        recorded, linked = link(chain[-1])
+        if linked is None:
+            return chain
+        chain.append(linked if recorded == chain[-1] else mirror_state(linked))
+
+def search_dfs(start, heuristic='manhattan', pdb_file=None, depth_limit=None, iterative=False, tt_size=1 << 16,
+               stats=None):
+    """Return a path from the packed state <start> to a goal found depth-first, or None.
+
+    Every state on the current path keeps one iterator over its successors,
+    which are tried lowest heuristic estimate first. Without a limit every
+    state reached is remembered, which is what keeps the search from going
+    round in circles. With <depth_limit> a successor is cut off once its moves
+    plus its estimate exceed the limit, and a state is searched again when it is
+    reached in fewer moves; the limit ends every path, so only the states on the
+    current path and a transposition table of at most <tt_size> move counts are
+    kept, and memory grows with the depth, not the breadth, of the search. With
+    <iterative> the limit starts at the estimate of <start> and is raised to the
+    smallest value cut off until a path turns up, which is then a shortest one,
+    or the limit passes <depth_limit>. Running out of states returns None, but
+    running into <depth_limit> raises DepthLimitReached.
+    """
+    successors_of, h, hook, every = _instrument(stats, load_heuristic(heuristic, start, pdb_file))
+    began = time.perf_counter()
+    expanded = generated = duplicates = peak = 0
+
+    def ordered(state):
+        nonlocal generated
+        successors = successors_of(state)
+        generated += len(successors)
+        # Equal estimates keep the order the old stack popped them in, the last generated first.
+        pairs = [(h(successor), successor) for successor in reversed(successors)]
+        pairs.sort(key=lambda pair: pair[0])
+        return iter(pairs)
+
+    def probe(limit):
+        """Search to <limit> moves; return the path found, or None, and the smallest value cut off."""
+        nonlocal expanded, duplicates, peak
+        cut = None
+        reached = {canonical_key(start): 0}
+        on_path = {canonical_key(start)}
+        path = [start]
+        # One iterator over (estimate, successor) pairs per state on the path.
+        stack = [ordered(start)]
+        expanded += 1
+        while stack:
+            estimate, successor = next(stack[-1], (None, None))
+            if successor is None:
+                stack.pop()
+                on_path.discard(canonical_key(path.pop()))
                 continue
-            seen.add(display_grid(curr))
-            if is_goal(curr):
-                for state in path + [curr]:
-                    f.write(display_grid(state) + '\n')
-                return curr
-            for successor in get_successors(curr):
-                stack.append((successor, path + [curr]))
-        return None
+            moves = len(path)
+            if limit is not None and moves + estimate > limit:
+                if cut is None or moves + estimate < cut:
+                    cut = moves + estimate
+                continue
+            key = canonical_key(successor)
+            if key in on_path or key in reached and (limit is None or reached[key] <= moves):
+                duplicates += 1
+                continue
+            if limit is None or len(reached) < tt_size or key in reached:
+                reached[key] = moves
+            if is_goal_packed(successor):
+                return path + [successor], cut
+            path.append(successor)
+            on_path.add(key)
+            stack.append(ordered(successor))
+            expanded += 1
+            if hook is not None and not expanded % every:
+                hook(successor, expanded)
+            if len(stack) > peak:
+                peak = len(stack)
+        return None, cut
 
-def run_astar(grid, output_file, debug=False):
-    with open(output_file, 'w') as f:
-        path = []
-        queue = PriorityQueue()
-        moves = 0
-        queue.put((get_manhattan_distance(grid), (grid, moves, path)))
-        seen = set()
-        while not queue.empty():
-            curr, moves, path = queue.get()[1]
-            if display_grid(curr) in seen:
+    if is_goal_packed(start):
+        return [start]
+    try:
+        if not iterative:
+            path, limit = probe(depth_limit)
+        else:
+            limit = h(start)
+            path = None
+            while path is None and limit is not None and (depth_limit is None or limit <= depth_limit):
+                if stats is not None:
+                    stats.f_progression.append([limit, expanded])
+                path, limit = probe(limit)
+        if path is None and limit is not None:
+            raise DepthLimitReached(f"no solution within {depth_limit} moves")
+        return path
+    finally:
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+
+def _per_piece_move(h, blanks):
+    """Return <h>, a bound on slides, turned into a bound on piece moves of at most <blanks> slides each."""
+    def estimate(state):
+        return -(-h(state) // blanks)
+    return estimate
+
+def search_astar(start, debug=False, heuristic='manhattan', pdb_file=None, macro=False, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None.
+
+    With <macro> the path is shortest in piece moves rather than slides, each
+    step of it being one piece move. A piece move takes at most one slide per
+    empty cell, so the heuristic is divided by the number of empty cells.
+    """
+    h = load_heuristic(heuristic, start, pdb_file)
+    if macro:
+        h = _per_piece_move(h, max(1, _cells_with_code(start, EMPTY).bit_count()))
+    successors_of, h, hook, every = _instrument(stats, h,
+                                                get_macro_successors_packed if macro else get_successors_packed)
+    began = time.perf_counter()
+    # Frontier entries are (f, -g, tie, state, parent): equal f-values prefer the
+    # deeper node, then insertion order, so states themselves are never compared.
+    tie = count()
+    queue = [(h(start), 0, next(tie), start, None)]
+    best_g = {canonical_key(start): 0}
+    parents = {}
+    expanded = generated = duplicates = peak = 0
+    last_f = -1
+    try:
+        while queue:
+            f, neg_moves, _, curr, parent = heapq.heappop(queue)
+            key = canonical_key(curr)
+            if key in parents:
                 continue
-            seen.add(display_grid(curr))
-            if is_goal(curr):
-                for state in path + [curr]:
-                    f.write(display_grid(state) + '\n')
-                return curr
+            parents[key] = parent
+            moves = -neg_moves
+            if is_goal_packed(curr):
+                return reconstruct_path(parents, curr)
             if debug:
-                print(display_grid(curr), moves)
-            for successor in get_successors(curr):
-                queue.put((get_manhattan_distance(successor) + moves + 1, (successor, moves + 1, path + [curr])))
+                print(display_state(curr), moves)
+            if f > last_f and stats is not None:
+                stats.f_progression.append([f, expanded])
+                last_f = f
+            expanded += 1
+            if hook is not None and not expanded % every:
+                hook(curr, expanded)
+            successors = successors_of(curr, parent) if macro else successors_of(curr)
+            generated += len(successors)
+            for successor in successors:
+                key = canonical_key(successor)
+                if key in parents or best_g.get(key, moves + 2) <= moves + 1:
+                    duplicates += 1
+                    continue
+                best_g[key] = moves + 1
+                f = h(successor) + moves + 1
+                heapq.heappush(queue, (f, neg_moves - 1, next(tie), successor, curr))
+            if len(queue) > peak:
+                peak = len(queue)
         return None
+    except MemoryBudgetExceeded as e:
+        if not macro:
+            # The hook runs before <curr> is expanded, so it is still open.
+            del parents[canonical_key(curr)]
+
+            def open_states():
+                yield moves, curr
+                for _, neg_g, _, state, _ in queue:
+                    key = canonical_key(state)
+                    if key not in parents and best_g[key] == -neg_g:
+                        yield -neg_g, state
+
+            e.closed = ((key, best_g[key]) for key in parents)
+            e.frontier = open_states()
+        raise
+    finally:
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+
+def search_idastar(start, heuristic='manhattan', pdb_file=None, tt_size=1 << 16, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None.
+
+    Iterative deepening on f = g + h: each iteration is a depth-first search that
+    cuts off nodes whose f exceeds the bound, and the next bound is the smallest f
+    that was cut off. Memory is linear in the depth plus tables of at most
+    <tt_size> entries each: the lowest g each state was reached with during the
+    current iteration, and the backed-up heuristic of every fully searched state,
+    which is kept across iterations so finished subtrees are not searched again.
+    Once every state ever generated has also been expanded the whole reachable
+    space has been covered, which proves the board unsolvable; this check gives up
+    when more than <tt_size> states have been expanded.
+    """
+    successors_of, h, hook, every = _instrument(stats, load_heuristic(heuristic, start, pdb_file))
+    began = time.perf_counter()
+    learned = {}
+
+    def estimate(state, key):
+        return max(h(state), learned.get(key, 0))
+
+    if is_goal_packed(start):
+        return [start]
+    expansions = generations = duplicates = peak = 0
+    try:
+        bound = estimate(start, canonical_key(start))
+        expanded = {canonical_key(start)}
+        unexpanded = set()
+        while bound is not None:
+            if stats is not None:
+                stats.f_progression.append([bound, expansions])
+            next_bound = None
+            reached = {}
+            path = [start]
+            on_path = {canonical_key(start)}
+            # One [successor iterator, smallest f below] pair per state on the path.
+            stack = [[iter(successors_of(start)), float('inf')]]
+            expansions += 1
+            while stack:
+                frame = stack[-1]
+                successor = next(frame[0], None)
+                if successor is None:
+                    # Every successor is accounted for, so the smallest f below this
+                    # state is an admissible estimate for it from now on.
+                    stack.pop()
+                    key = canonical_key(path.pop())
+                    on_path.discard(key)
+                    if len(learned) < tt_size or key in learned:
+                        learned[key] = max(learned.get(key, 0), frame[1] - len(path))
+                    if stack:
+                        stack[-1][1] = min(stack[-1][1], frame[1])
+                    continue
+                generations += 1
+                moves = len(path)
+                key = canonical_key(successor)
+                f = moves + estimate(successor, key)
+                if f > bound:
+                    if next_bound is None or f < next_bound:
+                        next_bound = f
+                    frame[1] = min(frame[1], f)
+                    if expanded is not None and key not in expanded:
+                        unexpanded.add(key)
+                    continue
+                if key in on_path or reached.get(key, moves + 1) <= moves:
+                    duplicates += 1
+                    frame[1] = min(frame[1], f)
+                    continue
+                if is_goal_packed(successor):
+                    return path + [successor]
+                if len(reached) < tt_size or key in reached:
+                    reached[key] = moves
+                if expanded is not None:
+                    expanded.add(key)
+                    unexpanded.discard(key)
+                    if len(expanded) > tt_size:
+                        expanded, unexpanded = None, None
+                path.append(successor)
+                on_path.add(key)
+                stack.append([iter(successors_of(successor)), float('inf')])
+                expansions += 1
+                if hook is not None and not expansions % every:
+                    hook(successor, expansions)
+                if len(path) > peak:
+                    peak = len(path)
+            if expanded is not None and not unexpanded:
+                return None
+            bound = next_bound
+        return None
+    finally:
+        if stats is not None:
+            stats.add(expansions, generations, duplicates, peak, time.perf_counter() - began)
+
+AWASTAR_WEIGHTS = (5, 3, 2, 1.5, 1.25, 1)
+
+def search_awastar(start, heuristic='manhattan', pdb_file=None, time_budget=None, weights=AWASTAR_WEIGHTS,
+                   stats=None):
+    """Return (path, bound): a path from the packed state <start> to a goal and a
+    proven bound on its length over the shortest one, or (None, None).
 
-def run_search(algo, grid, output_file, debug=False):
+    Anytime repairing A*: a search ordered by f = g + w * h for each weight of
+    <weights> in turn, stopping each pass once no open state can beat the best
+    solution so far. The open list carries over from one pass to the next,
+    together with the closed states whose g improved, so lowering w never
+    restarts the search. After <time_budget> seconds the best solution found so
+    far is returned; the first solution is always waited for.
+    """
+    successors_of, h, hook, every = _instrument(stats, load_heuristic(heuristic, start, pdb_file))
+    began = time.perf_counter()
+    stop = None if time_budget is None else began + time_budget
+    if is_goal_packed(start):
+        if stats is not None:
+            stats.suboptimality = 1.0
+        return [start], 1.0
+    key = canonical_key(start)
+    # g, h, parent and the instance among a state and its mirror image that the
+    # links refer to, all by canonical key
+    best_g = {key: 0}
+    estimates = {key: h(start)}
+    parents = {key: None}
+    instances = {key: start}
+    opened = {key}
+    inconsistent = set()
+    best, goal = None, None
+    expanded = generated = duplicates = peak = 0
+    out_of_time = False
+    try:
+        for w in weights:
+            opened |= inconsistent
+            inconsistent = set()
+            closed = set()
+            tie = count()
+            queue = [(best_g[key] + w * estimates[key], next(tie), best_g[key], key) for key in opened]
+            heapq.heapify(queue)
+            if stats is not None:
+                stats.f_progression.append([w, expanded])
+            while queue and (best is None or queue[0][0] < best):
+                _, _, moves, key = heapq.heappop(queue)
+                if key not in opened or moves != best_g[key]:
+                    continue
+                # Checked before <key> leaves the open set, so the bound below still counts it.
+                if stop is not None and goal is not None and not expanded % 256 and time.perf_counter() > stop:
+                    out_of_time = True
+                    break
+                opened.discard(key)
+                closed.add(key)
+                curr = instances[key]
+                expanded += 1
+                if hook is not None and not expanded % every:
+                    hook(curr, expanded)
+                moves += 1
+                successors = successors_of(curr)
+                generated += len(successors)
+                for successor in successors:
+                    key = canonical_key(successor)
+                    if best_g.get(key, moves + 1) <= moves:
+                        duplicates += 1
+                        continue
+                    instance = instances.setdefault(key, successor)
+                    parents[key] = curr if instance == successor else mirror_state(curr)
+                    best_g[key] = moves
+                    if is_goal_packed(successor):
+                        if best is None or moves < best:
+                            best, goal = moves, instance
+                        continue
+                    if key not in estimates:
+                        estimates[key] = h(successor)
+                    if key in closed:
+                        inconsistent.add(key)
+                    else:
+                        opened.add(key)
+                        heapq.heappush(queue, (moves + w * estimates[key], next(tie), moves, key))
+                if len(queue) > peak:
+                    peak = len(queue)
+            if out_of_time:
+                break
+        if goal is None:
+            return None, None
+        # Every shorter solution would pass through an open or inconsistent state.
+        lower = min([best] + [best_g[key] + estimates[key] for key in opened | inconsistent])
+        bound = best / lower if lower else 1.0
+        if stats is not None:
+            stats.suboptimality = bound
+
+        def link(state):
+            key = canonical_key(state)
+            return instances[key], parents[key]
+
+        path = follow_mirrored_links(link, goal)
+        path.reverse()
+        if path[0] != start:
+            path = [mirror_state(state) for state in path]
+        return path, bound
+    finally:
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+
+def search_bfs(start, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None, by breadth-first search."""
+    successors_of, _, hook, every = _instrument(stats)
+    began = time.perf_counter()
+    parents = {canonical_key(start): None}
+    frontier = [start]
+    expanded = generated = duplicates = peak = 0
+    try:
+        if is_goal_packed(start):
+            return [start]
+        while frontier:
+            layer = []
+            for state in frontier:
+                expanded += 1
+                if hook is not None and not expanded % every:
+                    hook(state, expanded)
+                successors = successors_of(state)
+                generated += len(successors)
+                for successor in successors:
+                    key = canonical_key(successor)
+                    if key in parents:
+                        duplicates += 1
+                        continue
+                    parents[key] = state
+                    if is_goal_packed(successor):
+                        return reconstruct_path(parents, successor)
+                    layer.append(successor)
+            frontier = layer
+            peak = max(peak, len(frontier))
+        return None
+    finally:
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+
+# The most goal states search_bibfs seeds its backward search with.
+MAX_GOAL_STATES = 1 << 16
+
+def search_bibfs(start, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None.
+
+    Searches breadth-first from the start and backwards from every goal state at once,
+    or only forwards when there are more than MAX_GOAL_STATES goal states.
+
+    Moves are reversible, so the predecessors the backward search needs are just
+    get_successors_packed. Each round expands one full layer of the smaller
+    frontier; the first state generated that the other side has already visited
+    joins a shortest path.
+    """
+    successors_of, _, hook, every = _instrument(stats)
+    began = time.perf_counter()
+    forward = {canonical_key(start): None}
+    backward = {}
+    goals = []
+    for goal in iter_goal_states(piece_counts(start)):
+        key = canonical_key(goal)
+        if key not in backward:
+            backward[key] = None
+            goals.append(goal)
+            if len(goals) > MAX_GOAL_STATES:
+                # Larger boards have far too many goal states to search back
+                # from; the goal is then only searched for forwards.
+                return search_bfs(start, stats)
+    links = [forward, backward]
+    frontiers = [[start], goals]
+    meeting = start if canonical_key(start) in backward else None
+    expanded = generated = duplicates = peak = 0
+    try:
+        while meeting is None and frontiers[0] and frontiers[1]:
+            side = 0 if len(frontiers[0]) <= len(frontiers[1]) else 1
+            own, other = links[side], links[1 - side]
+            layer = []
+            for state in frontiers[side]:
+                expanded += 1
+                if hook is not None and not expanded % every:
+                    hook(state, expanded)
+                successors = successors_of(state)
+                generated += len(successors)
+                for successor in successors:
+                    key = canonical_key(successor)
+                    if key in own:
+                        duplicates += 1
+                        continue
+                    own[key] = state
+                    if key in other:
+                        meeting = successor
+                        break
+                    layer.append(successor)
+                if meeting is not None:
+                    break
+            frontiers[side] = layer
+            peak = max(peak, len(frontiers[0]) + len(frontiers[1]))
+    finally:
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+    if meeting is None:
+        return None
+
+    # Both maps are keyed by canonical_key, so the state one side generates may
+    # be the reflection of the one the other side stored; the stored state is
+    # the one adjacent to its link.
+    def linker(links):
+        def link(state):
+            linked = links[canonical_key(state)]
+            if linked is None or linked in get_successors_packed(state):
+                return state, linked
+            return mirror_state(state), linked
+        return link
+
+    path = follow_mirrored_links(linker(forward), meeting)
+    path.reverse()
+    path += follow_mirrored_links(linker(backward), meeting)[1:]
+    if path[0] != start:
+        path = [mirror_state(state) for state in path]
+    return path
+
+ALGORITHMS = ['astar', 'awastar', 'bibfs', 'dfs', 'extbfs', 'hdastar', 'idastar', 'npbfs', 'retro']
+
+def solve(algo, start, debug=False, heuristic='manhattan', pdb_file=None, table_file=None, tt_size=1 << 16,
+          time_budget=None, workers=None, max_memory=None, spill_directory=None, depth_limit=None,
+          iterative=False, macro=False, stats=None):
+    """Return the path <algo> finds from the packed state <start> to a goal, or None.
+
+    A SearchStats passed as <stats> is filled in with the work the search did;
+    for awastar it also receives the suboptimality bound. With <max_memory>
+    bytes, a search that outgrows it is finished by external-memory BFS, which
+    keeps its layers in <spill_directory>. With <macro> astar counts piece moves
+    instead of slides and every step of the path is one piece move.
+    """
+    if macro and (algo != 'astar' or max_memory is not None):
+        raise ValueError("piece moves are only searched by astar without a memory budget")
+    if max_memory is not None:
+        from hrd_external import solve_within
+        return solve_within(algo, start, max_memory, spill_directory, stats=stats, debug=debug, heuristic=heuristic,
+                            pdb_file=pdb_file, table_file=table_file, tt_size=tt_size, time_budget=time_budget,
+                            workers=workers, depth_limit=depth_limit, iterative=iterative)
     if algo == 'dfs':
-        return run_dfs(grid, output_file)
+        return search_dfs(start, heuristic=heuristic, pdb_file=pdb_file, depth_limit=depth_limit,
+                          iterative=iterative, tt_size=tt_size, stats=stats)
     elif algo == 'astar':
-        return run_astar(grid, output_file, debug=debug)
+        return search_astar(start, debug=debug, heuristic=heuristic, pdb_file=pdb_file, macro=macro, stats=stats)
+    elif algo == 'awastar':
+        return search_awastar(start, heuristic=heuristic, pdb_file=pdb_file, time_budget=time_budget,
+                              stats=stats)[0]
+    elif algo == 'bibfs':
+        return search_bibfs(start, stats=stats)
+    elif algo == 'extbfs':
+        from hrd_external import search_external
+        return search_external(start, directory=spill_directory, stats=stats)
+    elif algo == 'hdastar':
+        from hrd_parallel import search_hdastar
+        return search_hdastar(start, workers=workers, heuristic=heuristic, pdb_file=pdb_file, stats=stats)
+    elif algo == 'idastar':
+        return search_idastar(start, heuristic=heuristic, pdb_file=pdb_file, tt_size=tt_size, stats=stats)
+    elif algo == 'npbfs':
+        from hrd_numpy import search_bfs_numpy
+        return search_bfs_numpy(start, stats=stats)
+    elif algo == 'retro':
+        from hrd_retro import DistanceTable
+        return open_table(DistanceTable, table_file).solve(start, stats=stats)
+    raise ValueError(f"unknown algorithm {algo!r}")
+
+OUTPUT_FORMATS = ['grids', 'moves']
+
+def _finish(path, output_file, output_format='grids'):
+    """Write <path> to <output_file> and return its final grid, or None when there is no path.
+
+    <output_format> is 'grids' for one grid per state or 'moves' for the start
+    grid and a compact move list, which hrd_moves.py replays.
+    """
+    if output_format == 'moves':
+        from hrd_moves import write_moves
+        write_moves(path or [], output_file)
+    elif output_format == 'grids':
+        write_solution(path or [], output_file)
+    else:
+        raise ValueError(f"unknown output format {output_format!r}")
+    return decode_state(path[-1]) if path else None
+
+def run_dfs(grid, output_file, depth_limit=None, iterative=False, tt_size=1 << 16):
+    return _finish(search_dfs(encode_grid(grid), depth_limit=depth_limit, iterative=iterative, tt_size=tt_size),
+                   output_file)
+
+def run_astar(grid, output_file, debug=False, heuristic='manhattan', pdb_file=None):
+    return _finish(search_astar(encode_grid(grid), debug=debug, heuristic=heuristic, pdb_file=pdb_file),
+                   output_file)
+
+def run_bibfs(grid, output_file):
+    return _finish(search_bibfs(encode_grid(grid)), output_file)
+
+def run_idastar(grid, output_file, heuristic='manhattan', pdb_file=None, tt_size=1 << 16):
+    return _finish(search_idastar(encode_grid(grid), heuristic=heuristic, pdb_file=pdb_file, tt_size=tt_size),
+                   output_file)
+
+def run_search(algo, grid, output_file, debug=False, heuristic='manhattan', pdb_file=None, table_file=None,
+               tt_size=1 << 16, cache=None, stats=None, output_format='grids', time_budget=None, workers=None,
+               max_memory=None, spill_directory=None, depth_limit=None, iterative=False, macro=False):
+    """Solve <grid> with <algo> and write the solution to <output_file>.
+
+    When a hrd_cache.SolutionCache is given as <cache>, it is consulted first.
+    A SearchStats given as <stats> is filled in with the work the search did;
+    it is left untouched when the solution comes from the cache. <output_format>
+    is as for _finish. With <macro> the solution is shortest in piece moves,
+    which are written out slide by slide.
+    """
+    solver = solve if cache is None else cache.solve
+    path = solver(algo, encode_grid(grid), debug=debug, heuristic=heuristic, pdb_file=pdb_file,
+                  table_file=table_file, tt_size=tt_size, time_budget=time_budget, workers=workers,
+                  max_memory=max_memory, spill_directory=spill_directory, depth_limit=depth_limit,
+                  iterative=iterative, macro=macro, stats=stats)
+    if macro and path is not None:
+        if stats is not None:
+            stats.piece_moves = len(path) - 1
+        path = expand_macro_path(path)
+    return _finish(path, output_file, output_format)
+
 def output_file(filename, input_grid, output_grid):
     with open(f"{filename}", "w") as file:
         file.write(f"{display_grid(input_grid)}\n{display_grid(output_grid)}")
 
-if __name__ == "__main__":
+def add_search_arguments(parser, table_file=True):
+    """Add the --heuristic and --pdb-file options, and with <table_file> --table-file, to <parser>."""
+    parser.add_argument(
+        "--heuristic",
+        type=str,
+        default='manhattan',
+        choices=HEURISTICS,
+        help="The heuristic used by astar, awastar, idastar and hdastar, and to order dfs."
+    )
+    parser.add_argument(
+        "--pdb-file",
+        type=str,
+        default='hrd.pdb',
+        help="The pattern database built by hrd_pdb.py, used by the pdb heuristic."
+    )
+    if table_file:
+        parser.add_argument(
+            "--table-file",
+            type=str,
+            default='hrd.table',
+            help="The retrograde distance table built by hrd_retro.py, used by retro."
+        )
+
+def main():
+    """Solve the puzzle file named on the command line and write its solution."""
     parser = argparse.ArgumentParser()
     parser.add_argument(
         "--inputfile",
@@ -234,11 +1359,136 @@ if __name__ == "__main__":
         "--algo",
         type=str,
         required=True,
-        choices=['astar', 'dfs'],
+        choices=ALGORITHMS,
         help="The searching algorithm."
     )
+    parser.add_argument(
+        "--goal",
+        type=parse_cell,
+        default=None,
+        help="The ROW,COL of the top left cell of the goal position; overrides the puzzle file's '# goal' line."
+    )
+    parser.add_argument(
+        "--output-format",
+        type=str,
+        default='grids',
+        choices=OUTPUT_FORMATS,
+        help="Write every grid of the solution, or the start grid and a compact move list."
+    )
+    add_search_arguments(parser)
+    parser.add_argument(
+        "--tt-size",
+        type=int,
+        default=1 << 16,
+        help="The number of transposition table entries idastar and depth-limited dfs may keep."
+    )
+    parser.add_argument(
+        "--depth-limit",
+        type=int,
+        default=None,
+        help="The most moves dfs follows a path for."
+    )
+    parser.add_argument(
+        "--iterative-deepening",
+        action="store_true",
+        help="Run dfs with a growing depth limit, which finds a shortest solution."
+    )
+    parser.add_argument(
+        "--macro",
+        action="store_true",
+        help="Find the fewest piece moves, a move sliding one piece any distance, instead of slides; astar only."
+    )
+    parser.add_argument(
+        "--time-budget",
+        type=float,
+        default=None,
+        help="Milliseconds after which awastar returns the best solution found so far."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes hdastar uses; defaults to the number of cores."
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=parse_size,
+        default=None,
+        help="Memory, such as 512M or 2G, past which the search continues as BFS with its layers on disk."
+    )
+    parser.add_argument(
+        "--spill-directory",
+        type=str,
+        default=None,
+        help="Where --max-memory and extbfs keep layer files; defaults to the system temporary directory."
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=None,
+        help="An SQLite file solutions are cached in across runs."
+    )
+    parser.add_argument(
+        "--stats",
+        type=str,
+        default=None,
+        help="A JSON file the search statistics are written to."
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Split the time in --stats between successors, heuristic and bookkeeping; slows the search."
+    )
     args = parser.parse_args()
-    # read the board from the file
-    inp = create_grid_from_file(args.inputfile)
+    # read the board from the file; its size and goal set the geometry
+    try:
+        inp = load_puzzle(args.inputfile, args.goal)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    if args.algo == 'npbfs':
+        try:
+            importlib.import_module('hrd_numpy')
+        except ImportError as e:
+            parser.error(f"--algo npbfs: {e}")
+    if args.macro and (args.algo != 'astar' or args.max_memory is not None):
+        parser.error("--macro needs --algo astar and no --max-memory")
     # run specified algorithm on board
-    run_search(args.algo, inp, args.outputfile)
\ No newline at end of file
+    stats = SearchStats(timing=args.profile)
+    time_budget = None if args.time_budget is None else args.time_budget / 1000
+    limited = False
+    cache = None
+    if args.cache_file:
+        from hrd_cache import SolutionCache
+        cache = SolutionCache(filename=args.cache_file)
+    try:
+        run_search(args.algo, inp, args.outputfile, heuristic=args.heuristic, pdb_file=args.pdb_file,
+                   table_file=args.table_file, tt_size=args.tt_size, cache=cache, stats=stats,
+                   output_format=args.output_format, time_budget=time_budget, workers=args.workers,
+                   max_memory=args.max_memory, spill_directory=args.spill_directory, depth_limit=args.depth_limit,
+                   iterative=args.iterative_deepening, macro=args.macro)
+    except DepthLimitReached as e:
+        # no solution to write, but none may be left over from an earlier run either
+        _finish(None, args.outputfile, args.output_format)
+        print(e)
+        limited = True
+    except ValueError as e:
+        # a table or database built for another board or piece set, among others
+        parser.error(str(e))
+    finally:
+        if cache is not None:
+            cache.close()
+    if stats.piece_moves is not None:
+        print(f"solution of {stats.piece_moves} piece moves")
+    if stats.suboptimality is not None:
+        print(f"solution at most {stats.suboptimality:.3f} times the optimal length")
+    if args.stats:
+        with open(args.stats, 'w') as f:
+            json.dump(stats.as_dict(), f, indent=1)
+    if limited:
+        parser.exit(1)
+
+if __name__ == "__main__":
+    # Run on the hrd module the solvers imported on demand share, not on a
+    # second copy of it as __main__, so the geometry set here is theirs.
+    import hrd
+    hrd.main()
@@ -0,0 +1,189 @@
+import argparse
+import glob
+import json
+import os
+import signal
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from hrd import (ALGORITHMS, DepthLimitReached, add_search_arguments, decode_state, display_state, encode_grid,
+                 parse_cell, read_puzzle, set_geometry, solve, use_board)
+from hrd_cache import SolutionCache
+from hrd_corpus import Corpus, read_geometry
+
+
+# Puzzles handed to the pool per worker at a time; more are read from the
+# source only as results come back, so a large corpus is never held in memory.
+WINDOW = 4
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+# The solution cache of this worker process, opened by the first puzzle it solves.
+_cache = None
+
+
+def _raise_timeout(signum, frame):
+    raise SolveTimeout()
+
+
+def load_puzzles(source):
+    """Yield (puzzle id, grid, goal) for every puzzle named by <source>.
+
+    <source> is a directory, a glob pattern, a corpus file written by
+    hrd_corpus.py (ids are record numbers) or a JSONL manifest whose lines hold
+    an "id" and either an "inputfile" (relative to the manifest) or a "grid" of
+    rows and optionally a "goal" written as 'ROW,COL'. The goal is the (row,
+    column) a puzzle file or manifest line names, or None for the default goal
+    position; reading a corpus plays on the geometry it was built for.
+    """
+    if source.endswith('.hrdc'):
+        width, height, goal_row, goal_col = read_geometry(source)
+        set_geometry(width, height, goal_row, goal_col)
+        corpus = Corpus(source)
+        try:
+            for n, state in enumerate(corpus):
+                yield n, decode_state(state), (goal_row, goal_col)
+        finally:
+            corpus.close()
+        return
+    if source.endswith('.jsonl'):
+        base = os.path.dirname(source)
+        with open(source) as f:
+            for n, line in enumerate(f):
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if 'grid' in entry:
+                    grid = [list(row) for row in entry['grid']]
+                    goal = parse_cell(entry['goal']) if 'goal' in entry else None
+                else:
+                    grid, goal = read_puzzle(os.path.join(base, entry['inputfile']))
+                yield entry.get('id', entry.get('inputfile', n)), grid, goal
+        return
+    if os.path.isdir(source):
+        filenames = sorted(os.path.join(source, name) for name in os.listdir(source))
+    else:
+        filenames = sorted(glob.glob(source))
+    for filename in filenames:
+        if os.path.isfile(filename):
+            yield (filename,) + read_puzzle(filename)
+
+
+def solve_puzzle(puzzle_id, grid, algo, timeout=None, cache_file=None, goal=None, **options):
+    """Solve one puzzle in a worker process and return its result record.
+
+    The worker plays on the board size of <grid> with the goal at <goal>. With
+    a <cache_file>, every worker shares solutions through that SQLite cache.
+    """
+    global _cache
+    solver = solve
+    if cache_file is not None:
+        if _cache is None:
+            _cache = SolutionCache(filename=cache_file)
+        solver = _cache.solve
+    began = time.perf_counter()
+    if timeout:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        use_board(grid, goal)
+        path = solver(algo, encode_grid(grid), **options)
+    except SolveTimeout:
+        return {'id': puzzle_id, 'status': 'timeout', 'seconds': timeout}
+    except DepthLimitReached:
+        return {'id': puzzle_id, 'status': 'limited', 'seconds': round(time.perf_counter() - began, 6)}
+    except Exception as e:
+        return {'id': puzzle_id, 'status': 'error', 'error': str(e)}
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    result = {'id': puzzle_id, 'seconds': round(time.perf_counter() - began, 6)}
+    if path is None:
+        result['status'] = 'unsolvable'
+    else:
+        result.update(status='solved', moves=len(path) - 1, solution=[display_state(state) for state in path])
+    return result
+
+
+def run_batch(puzzles, algo, out, workers=None, timeout=None, cache_file=None, **options):
+    """Solve <puzzles> on a process pool, writing one JSON line to <out> as each finishes.
+
+    <puzzles> holds (puzzle id, grid, goal) triples, as load_puzzles yields.
+    Puzzles still running after <timeout> seconds are dropped and reported with
+    status "timeout". At most WINDOW puzzles per worker are pending at a time.
+    Returns the number of puzzles solved.
+    """
+    solved = 0
+    workers = workers or os.cpu_count()
+    puzzles = iter(puzzles)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        def submit(n):
+            return {pool.submit(solve_puzzle, puzzle_id, grid, algo, timeout, cache_file, goal, **options)
+                    for puzzle_id, grid, goal in islice(puzzles, n)}
+
+        pending = submit(WINDOW * workers)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                solved += result['status'] == 'solved'
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+            pending |= submit(len(done))
+    return solved
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve many puzzles concurrently.")
+    parser.add_argument(
+        "--puzzles",
+        type=str,
+        required=True,
+        help="A directory, glob pattern or JSONL manifest of puzzles."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        default='-',
+        help="The JSONL file results are streamed to; - for stdout."
+    )
+    parser.add_argument(
+        "--algo",
+        type=str,
+        required=True,
+        choices=ALGORITHMS,
+        help="The searching algorithm."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes; defaults to the number of cores."
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        help="Seconds after which a puzzle is dropped."
+    )
+    add_search_arguments(parser)
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=None,
+        help="An SQLite solution cache shared by all workers."
+    )
+    args = parser.parse_args()
+    out = sys.stdout if args.outputfile == '-' else open(args.outputfile, 'w')
+    try:
+        run_batch(load_puzzles(args.puzzles), args.algo, out, workers=args.workers, timeout=args.timeout,
+                  cache_file=args.cache_file, heuristic=args.heuristic, pdb_file=args.pdb_file,
+                  table_file=args.table_file)
+    finally:
+        if out is not sys.stdout:
+            out.close()
@@ -0,0 +1,195 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import time
+
+from hrd import ALGORITHMS, SearchStats, add_search_arguments, encode_grid, solve, use_board
+from hrd_batch import load_puzzles
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bench', 'corpus.jsonl')
+# retro needs a table built for the component of each board, so it is only
+# benchmarked when asked for explicitly.
+DEFAULT_ALGOS = [algo for algo in ALGORITHMS if algo != 'retro']
+# Differences in wall time below this many seconds are noise, not regressions.
+TIME_SLACK = 0.005
+
+
+def _measure(conn, algo, grid, goal, repeat, options):
+    """Solve <grid> <repeat> times in this process and send the best run back through <conn>."""
+    try:
+        use_board(grid, goal)
+        start = encode_grid(grid)
+        best = None
+        for _ in range(repeat):
+            stats = SearchStats()
+            began = time.perf_counter()
+            path = solve(algo, start, stats=stats, **options)
+            seconds = time.perf_counter() - began
+            if best is None or seconds < best[0]:
+                best = (seconds, stats, path)
+        seconds, stats, path = best
+        result = {'status': 'unsolvable' if path is None else 'solved', 'seconds': round(seconds, 6)}
+        result.update(stats.as_dict())
+        result['nodes_per_second'] = round(stats.expanded / seconds) if seconds else None
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        result['peak_rss_kb'] = peak // 1024 if sys.platform == 'darwin' else peak
+        if path is not None:
+            result['moves'] = len(path) - 1
+    except Exception as e:
+        result = {'status': 'error', 'error': str(e)}
+    conn.send(result)
+    conn.close()
+
+
+def bench_one(puzzle_id, grid, algo, timeout=None, repeat=1, goal=None, **options):
+    """Benchmark one (board, algorithm) pair in a fresh process and return its record.
+
+    A fresh process keeps peak RSS per run and stops tables cached by one search
+    from speeding up the next. The board is played with the goal at <goal>.
+    """
+    context = multiprocessing.get_context('spawn')
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_measure, args=(sender, algo, grid, goal, repeat, options))
+    process.start()
+    sender.close()
+    record = {'id': puzzle_id, 'algo': algo}
+    if receiver.poll(timeout):
+        try:
+            record.update(receiver.recv())
+        except EOFError:
+            record.update(status='error', error=f"worker exited with code {process.exitcode}")
+    else:
+        process.terminate()
+        record.update(status='timeout', seconds=timeout)
+    process.join()
+    return record
+
+
+def run_benchmark(puzzles, algos, timeout=None, repeat=1, out=None, **options):
+    """Benchmark every algorithm of <algos> on every puzzle and return the report.
+
+    Each record is also printed to <out> as a line of text when it is given.
+    """
+    results = []
+    for puzzle_id, grid, goal in puzzles:
+        for algo in algos:
+            record = bench_one(puzzle_id, grid, algo, timeout=timeout, repeat=repeat, goal=goal, **options)
+            results.append(record)
+            if out is not None:
+                out.write(_describe(record) + '\n')
+                out.flush()
+    meta = {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'repeat': repeat,
+        'timeout': timeout,
+    }
+    return {'meta': meta, 'results': results}
+
+
+def _describe(record):
+    text = f"{record['id']:<32} {record['algo']:<8} {record['status']:<10}"
+    if 'expanded' in record:
+        text += (f" {record['seconds']:>10.4f}s {record['expanded']:>9} expanded {record['generated']:>9} generated"
+                 f" {record['nodes_per_second'] or 0:>9}/s {record['peak_rss_kb']:>8} KB")
+    if 'moves' in record:
+        text += f" {record['moves']:>4} moves"
+    if 'error' in record:
+        text += f" {record['error']}"
+    return text
+
+
+def compare(baseline, current, threshold=0.1):
+    """Return a description of every regression of <current> against <baseline>.
+
+    A run regresses when it no longer solves its board, finds a longer solution,
+    or takes more than <threshold> (a fraction) longer or more expansions.
+    Records are matched by puzzle id and algorithm.
+    """
+    before = {(record['id'], record['algo']): record for record in baseline['results']}
+    regressions = []
+    for record in current['results']:
+        old = before.get((record['id'], record['algo']))
+        if old is None:
+            continue
+        name = f"{record['id']} {record['algo']}"
+        if old['status'] != record['status']:
+            if old['status'] in ('solved', 'unsolvable'):
+                regressions.append(f"{name}: {old['status']} -> {record['status']}")
+            continue
+        if 'moves' in old and record.get('moves', 0) > old['moves']:
+            regressions.append(f"{name}: moves {old['moves']} -> {record['moves']}")
+        if 'seconds' in old and record['seconds'] > old['seconds'] * (1 + threshold) + TIME_SLACK:
+            regressions.append(f"{name}: seconds {old['seconds']} -> {record['seconds']}")
+        if 'expanded' in old and record['expanded'] > old['expanded'] * (1 + threshold):
+            regressions.append(f"{name}: expanded {old['expanded']} -> {record['expanded']}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the solvers on a corpus of boards.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="Run the benchmark and write a JSON report.")
+    run.add_argument(
+        "--corpus",
+        type=str,
+        default=CORPUS,
+        help="A directory, glob pattern or JSONL manifest of boards; defaults to bench/corpus.jsonl."
+    )
+    run.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The JSON report to write."
+    )
+    run.add_argument(
+        "--algo",
+        action="append",
+        choices=ALGORITHMS,
+        help="An algorithm to benchmark; may be repeated. Defaults to all but retro."
+    )
+    run.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Runs per board and algorithm; the fastest is reported."
+    )
+    run.add_argument(
+        "--timeout",
+        type=float,
+        default=60,
+        help="Seconds after which a run is stopped and reported as a timeout."
+    )
+    add_search_arguments(run)
+    diff = commands.add_parser('compare', help="Compare a report against a saved baseline.")
+    diff.add_argument("baseline", type=str, help="The baseline JSON report.")
+    diff.add_argument("current", type=str, help="The JSON report to check.")
+    diff.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="The fraction by which time or expansions may grow before it counts as a regression."
+    )
+    args = parser.parse_args()
+    if args.command == 'run':
+        report = run_benchmark(load_puzzles(args.corpus), args.algo or DEFAULT_ALGOS, timeout=args.timeout,
+                               repeat=args.repeat, out=sys.stdout, heuristic=args.heuristic,
+                               pdb_file=args.pdb_file, table_file=args.table_file)
+        with open(args.outputfile, 'w') as f:
+            json.dump(report, f, indent=1)
+    else:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        regressions = compare(baseline, current, threshold=args.threshold)
+        for regression in regressions:
+            print(regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,176 @@
+import sqlite3
+from collections import OrderedDict
+
+import hrd
+from hrd import canonical_key, geometry, mirror_state, solve
+
+# Every suffix of an optimal path is itself optimal, so these algorithms, and
+# dfs with iterative deepening, share one cache namespace and any state on a
+# cached path answers lookups too.
+# Paths of piece moves, which only astar searches for, are kept apart from
+# paths of slides in a namespace of their own.
+OPTIMAL_ALGOS = ('astar', 'bibfs', 'extbfs', 'hdastar', 'idastar', 'npbfs', 'retro')
+# A retrograde table only lists the boards of the component it was built for,
+# so finding no path there says nothing about whether a board is solvable.
+PATHS_ONLY_ALGOS = ('retro',)
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS solutions (id INTEGER PRIMARY KEY, path BLOB);
+CREATE TABLE IF NOT EXISTS states (
+    namespace TEXT, key TEXT, solution INTEGER, position INTEGER,
+    PRIMARY KEY (namespace, key)
+);
+'''
+
+
+def is_limited(algo, options):
+    """Return whether <options> cut the search of <algo> short, so its answer holds for those options only."""
+    if algo == 'awastar':
+        return options.get('time_budget') is not None
+    return algo == 'dfs' and options.get('depth_limit') is not None
+
+
+def _namespace(algo, macro=False, iterative=False):
+    """Return the namespace of <algo>'s solutions, in piece moves with <macro>.
+
+    dfs with <iterative> deepening finds shortest paths. Solutions only hold on the board geometry they were found on.
+    """
+    width, height, goal_row, goal_col = geometry()
+    kind = 'optimal' if algo in OPTIMAL_ALGOS or algo == 'dfs' and iterative else algo
+    return f"{kind}{'-macro' if macro else ''} {width}x{height} {goal_row},{goal_col}"
+
+
+def _shares_paths(namespace):
+    return namespace.startswith(('optimal ', 'optimal-macro '))
+
+
+def pack_path(path):
+    return b''.join(state.to_bytes(hrd.STATE_BYTES, 'big') for state in path)
+
+
+def unpack_path(blob):
+    size = hrd.STATE_BYTES
+    return [int.from_bytes(blob[k:k + size], 'big') for k in range(0, len(blob), size)]
+
+
+def _aligned(path, state):
+    """Return <path>, reflected if it starts at the mirror image of <state>."""
+    if path is None or path[0] == state:
+        return path
+    return [mirror_state(s) for s in path]
+
+
+class SolutionCache:
+    """Solutions keyed by canonical start state and algorithm.
+
+    Recent solutions live in a bounded in-memory LRU. When <filename> is given
+    they are also stored in an SQLite file that survives restarts and can be
+    shared by several processes.
+    """
+
+    def __init__(self, capacity=1024, filename=None):
+        self.capacity = capacity
+        self.hits = 0
+        self.misses = 0
+        # (namespace, root key) -> path, in least recently used order
+        self._paths = OrderedDict()
+        # (namespace, state key) -> ((namespace, root key), position on that path)
+        self._states = {}
+        self._db = None
+        if filename is not None:
+            self._db = sqlite3.connect(filename, timeout=30)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.executescript(_SCHEMA)
+
+    def _remember(self, namespace, state, path):
+        root = (namespace, canonical_key(state))
+        self._paths[root] = path
+        self._paths.move_to_end(root)
+        if path is None or not _shares_paths(namespace):
+            self._states[root] = (root, 0)
+        else:
+            for position, s in enumerate(path):
+                self._states[(namespace, canonical_key(s))] = (root, position)
+        while len(self._paths) > self.capacity:
+            old_root, old_path = self._paths.popitem(last=False)
+            for s in old_path or [None]:
+                key = old_root if s is None else (old_root[0], canonical_key(s))
+                if self._states.get(key, (None,))[0] == old_root:
+                    del self._states[key]
+
+    def _load(self, namespace, state):
+        """Copy the stored solution covering <state> from disk into memory."""
+        row = self._db.execute('SELECT solution, position FROM states WHERE namespace = ? AND key = ?',
+                               (namespace, format(canonical_key(state), 'x'))).fetchone()
+        if row is None:
+            raise KeyError(state)
+        solution, position = row
+        blob, = self._db.execute('SELECT path FROM solutions WHERE id = ?', (solution,)).fetchone()
+        path = None if blob is None else unpack_path(blob)
+        self._remember(namespace, state if path is None else path[0], path)
+        return path, position
+
+    def get(self, algo, state, macro=False, iterative=False):
+        """Return the cached path from <state>, or None if it is known to be unsolvable.
+
+        With <macro> the path is one of piece moves; with <iterative> it is one
+        dfs with iterative deepening would find. Raises KeyError when <state> is
+        not cached for <algo>.
+        """
+        namespace = _namespace(algo, macro, iterative)
+        entry = self._states.get((namespace, canonical_key(state)))
+        try:
+            if entry is not None:
+                root, position = entry
+                path = self._paths[root]
+                self._paths.move_to_end(root)
+            elif self._db is not None:
+                path, position = self._load(namespace, state)
+            else:
+                raise KeyError(state)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return _aligned(None if path is None else path[position:], state)
+
+    def put(self, algo, state, path, macro=False, iterative=False):
+        """Cache <path>, the solution <algo> found from <state> (None when unsolvable), in piece moves with <macro>.
+
+        <iterative> is as for get. A None from an algorithm of PATHS_ONLY_ALGOS
+        is not cached.
+        """
+        if path is None and algo in PATHS_ONLY_ALGOS:
+            return
+        namespace = _namespace(algo, macro, iterative)
+        self._remember(namespace, state, path)
+        if self._db is None:
+            return
+        with self._db:
+            cursor = self._db.execute('INSERT INTO solutions (path) VALUES (?)',
+                                      (None if path is None else pack_path(path),))
+            states = [state] if path is None or not _shares_paths(namespace) else path
+            self._db.executemany('INSERT OR IGNORE INTO states VALUES (?, ?, ?, ?)',
+                                 [(namespace, format(canonical_key(s), 'x'), cursor.lastrowid, position)
+                                  for position, s in enumerate(states)])
+
+    def solve(self, algo, start, **options):
+        """Return the cached path from <start>, solving and caching it on a miss.
+
+        Searches cut short by their <options> bypass the cache.
+        """
+        if is_limited(algo, options):
+            return solve(algo, start, **options)
+        macro = options.get('macro', False)
+        iterative = options.get('iterative', False)
+        try:
+            return self.get(algo, start, macro, iterative)
+        except KeyError:
+            pass
+        path = solve(algo, start, **options)
+        self.put(algo, start, path, macro, iterative)
+        return path
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
@@ -0,0 +1,139 @@
+import argparse
+import mmap
+import os
+import struct
+
+import hrd
+from hrd import check_geometry, decode_state, encode_grid, geometry, use_board
+
+# A corpus file holds many boards as fixed-size records: the packed state of
+# each board, big-endian, after a header. Board n is at a known offset, so a
+# memory-mapped corpus hands out boards by index without reading the rest.
+MAGIC = b'HRDCRP\x02\x00'
+HEADER = struct.Struct('<8sHHHHHxxxxxxQ')   # magic, width, height, goal row, goal column, record bytes, records
+CHUNK = 1 << 16
+
+
+def write_corpus(filename, states):
+    """Write the packed states <states> to the corpus file <filename> and return how many there were.
+
+    Records are as wide as the states of the geometry in play once <states> is
+    exhausted, since generating them may set it. The records go to a '.partial'
+    file beside <filename>, which replaces it only once every state is in, so
+    an exception raised by <states> leaves no partial corpus behind.
+    """
+    n = 0
+    partial = f"{filename}.partial"
+    try:
+        with open(partial, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, *geometry(), 0, 0))
+            chunk = []
+            for state in states:
+                chunk.append(state.to_bytes(hrd.STATE_BYTES, 'big'))
+                if len(chunk) == CHUNK:
+                    f.write(b''.join(chunk))
+                    n += len(chunk)
+                    chunk = []
+            f.write(b''.join(chunk))
+            n += len(chunk)
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, *geometry(), hrd.STATE_BYTES, n))
+    except BaseException:
+        os.remove(partial)
+        raise
+    os.replace(partial, filename)
+    return n
+
+
+def convert(puzzles, filename):
+    """Validate and pack the (puzzle id, grid, goal) triples <puzzles> into the corpus file <filename>.
+
+    The first puzzle sets the board geometry of the corpus. Raises ValueError
+    naming the first puzzle whose pieces are malformed or whose geometry differs.
+    """
+    def states():
+        board = None
+        for puzzle_id, grid, goal in puzzles:
+            try:
+                use_board(grid, goal)
+                if board is not None and geometry() != board:
+                    raise ValueError("the board geometry differs from the first puzzle's")
+            except ValueError as e:
+                raise ValueError(f"{puzzle_id}: {e}") from None
+            board = geometry()
+            yield encode_grid(grid)
+    return write_corpus(filename, states())
+
+
+def read_geometry(filename):
+    """Return the (width, height, goal row, goal column) the corpus in <filename> was built for."""
+    with open(filename, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or not header.startswith(MAGIC):
+        raise ValueError(f"{filename} is not a puzzle corpus")
+    return HEADER.unpack(header)[1:5]
+
+
+class Corpus:
+    """A corpus file, memory-mapped; indexing and iteration give packed states."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, width, height, goal_row, goal_col, record_bytes, records = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a puzzle corpus")
+        check_geometry(filename, (width, height, goal_row, goal_col), record_bytes)
+        if len(self._mmap) != HEADER.size + records * record_bytes:
+            raise ValueError(f"{filename} is truncated")
+        self._records = records
+        self._record_bytes = record_bytes
+
+    def __len__(self):
+        return self._records
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += self._records
+        if not 0 <= index < self._records:
+            raise IndexError(index)
+        size = self._record_bytes
+        start = HEADER.size + index * size
+        return int.from_bytes(self._mmap[start:start + size], 'big')
+
+    def __iter__(self):
+        size = self._record_bytes
+        for start in range(HEADER.size, len(self._mmap), CHUNK * size):
+            block = self._mmap[start:start + CHUNK * size]
+            for k in range(0, len(block), size):
+                yield int.from_bytes(block[k:k + size], 'big')
+
+    def grid(self, index):
+        """Return board <index> as a list-of-lists grid."""
+        return decode_state(self[index])
+
+    def close(self):
+        self._mmap.close()
+
+
+if __name__ == "__main__":
+    from hrd_batch import load_puzzles
+
+    parser = argparse.ArgumentParser(description="Pack puzzle text files into a corpus file.")
+    parser.add_argument(
+        "--puzzles",
+        type=str,
+        required=True,
+        help="A directory, glob pattern or JSONL manifest of puzzles."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The corpus file to write."
+    )
+    args = parser.parse_args()
+    try:
+        convert(load_puzzles(args.puzzles), args.outputfile)
+    except ValueError as e:
+        parser.error(str(e))
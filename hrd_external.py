@@ -0,0 +1,403 @@
+import argparse
+import heapq
+import mmap
+import os
+import resource
+import sys
+import tempfile
+import time
+from bisect import bisect_left
+
+import hrd
+from hrd import (KeyView, MemoryBudgetExceeded, SearchStats, canonical_key, get_successors_packed, is_goal_packed,
+                 load_puzzle, parse_size, run_search, solve)
+
+# External-memory breadth-first search. Every layer is a file of sorted,
+# distinct canonical keys. The next layer is built by expanding the current one
+# into an in-memory buffer that is sorted and written out as a run whenever it
+# fills up; the runs are then merged in one sequential pass that drops
+# duplicates and every key of the two previous layers, which are the only
+# layers a slide can lead back to. Memory use is bounded by the buffer, not by
+# the number of states.
+#
+# A* handed over from memory leaves its closed states, written to one file per
+# g, and its open states, which become pending seeds: each joins the layer of
+# its g unless a layer before that already reached it. The closed g are exact,
+# so a key of a new layer need only be looked for among the closed states of
+# that layer's depth and the two before it.
+CHUNK = 1 << 16
+# Rough cost of a buffered key: a Python int plus its list slot and sorting slack.
+BYTES_PER_KEY = 128
+# Expansions between two checks of the process's memory.
+MEMORY_CHECK_EVERY = 4096
+# A pending seed is a canonical key, STATE_BYTES wide, followed by its g.
+G_BYTES = 2
+
+
+def peak_memory():
+    """Return the peak resident set size of this process in bytes."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def current_memory():
+    """Return the resident set size of this process in bytes, or its peak where that is all the system reports."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except OSError:
+        return peak_memory()
+
+
+def _write_keys(filename, keys):
+    """Write the sorted ints <keys> to <filename> and return how many there were."""
+    n = 0
+    key_bytes = hrd.STATE_BYTES
+    with open(filename, 'wb') as f:
+        chunk = []
+        for key in keys:
+            chunk.append(key.to_bytes(key_bytes, 'big'))
+            if len(chunk) == CHUNK:
+                f.write(b''.join(chunk))
+                n += len(chunk)
+                chunk = []
+        f.write(b''.join(chunk))
+        n += len(chunk)
+    return n
+
+
+def _read_keys(filename):
+    """Yield the keys of a file written by _write_keys, in order."""
+    key_bytes = hrd.STATE_BYTES
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(CHUNK * key_bytes)
+            if not block:
+                return
+            for k in range(0, len(block), key_bytes):
+                yield int.from_bytes(block[k:k + key_bytes], 'big')
+
+
+def _write_seeds(filename, seeds):
+    """Write the (key, g) pairs <seeds>, sorted by key and holding each key once, to <filename>.
+
+    Returns the smallest g, or None if there were no seeds.
+    """
+    lowest = None
+    last = None
+    key_bytes = hrd.STATE_BYTES
+    with open(filename, 'wb') as f:
+        chunk = []
+        for key, moves in seeds:
+            if key == last:
+                continue
+            last = key
+            lowest = moves if lowest is None else min(lowest, moves)
+            chunk.append(key.to_bytes(key_bytes, 'big') + moves.to_bytes(G_BYTES, 'big'))
+            if len(chunk) == CHUNK:
+                f.write(b''.join(chunk))
+                chunk = []
+        f.write(b''.join(chunk))
+    return lowest
+
+
+def _read_seeds(filename):
+    """Yield the (key, g) pairs of a file written by _write_seeds, in order."""
+    key_bytes = hrd.STATE_BYTES
+    seed_bytes = key_bytes + G_BYTES
+    with open(filename, 'rb') as f:
+        while True:
+            block = f.read(CHUNK * seed_bytes)
+            if not block:
+                return
+            for k in range(0, len(block), seed_bytes):
+                yield (int.from_bytes(block[k:k + key_bytes], 'big'),
+                       int.from_bytes(block[k + key_bytes:k + seed_bytes], 'big'))
+
+
+def _seeds_after(seeds, depth, layer):
+    """Yield the (key, g) pairs of <seeds> with g beyond <depth> whose key the sorted iterable <layer> lacks."""
+    layer = iter(layer)
+    head = next(layer, None)
+    for key, moves in seeds:
+        while head is not None and head < key:
+            head = next(layer, None)
+        if moves > depth and head != key:
+            yield key, moves
+
+
+def _spill_closed(workdir, closed, capacity):
+    """Write the (key, g) pairs <closed> to one sorted file per g; return {g: filename}.
+
+    At most <capacity> pairs are held at a time: whenever that many have been
+    read they are written out as one sorted run per g, and the runs of each g
+    are merged at the end.
+    """
+    runs = {}
+    by_g = {}
+    held = 0
+
+    def flush():
+        for moves, keys in by_g.items():
+            names = runs.setdefault(moves, [])
+            names.append(os.path.join(workdir, f'closed-{moves}-{len(names)}'))
+            _write_keys(names[-1], sorted(keys))
+        by_g.clear()
+
+    for key, moves in closed:
+        by_g.setdefault(moves, []).append(key)
+        held += 1
+        if held == capacity:
+            flush()
+            held = 0
+    flush()
+    filenames = {}
+    for moves, names in runs.items():
+        filenames[moves] = os.path.join(workdir, f'closed-{moves}')
+        _write_keys(filenames[moves], heapq.merge(*(_read_keys(run) for run in names)))
+        for run in names:
+            os.remove(run)
+    return filenames
+
+
+def _spill_seeds(workdir, filename, seeds, capacity):
+    """Write the (g, state) pairs <seeds> to <filename> as _write_seeds does, and return the smallest g.
+
+    At most <capacity> seeds are held at a time; each full buffer is written out
+    as a sorted run, and the runs are merged into <filename>.
+    """
+    runs = []
+    buffer = []
+    for moves, state in seeds:
+        buffer.append((canonical_key(state), moves))
+        if len(buffer) == capacity:
+            runs.append(os.path.join(workdir, f'seeds-{len(runs)}'))
+            _write_seeds(runs[-1], sorted(buffer))
+            buffer = []
+    # Each key sorts with its smallest g first, which is the one _write_seeds keeps.
+    lowest = _write_seeds(filename, heapq.merge(sorted(buffer), *(_read_seeds(run) for run in runs)))
+    for run in runs:
+        os.remove(run)
+    return lowest
+
+
+def _fresh(keys, *excluded):
+    """Yield the distinct keys of the sorted iterable <keys> that none of the sorted iterables <excluded> hold."""
+    excluded = [iter(keys_) for keys_ in excluded]
+    heads = [next(keys_, None) for keys_ in excluded]
+    last = None
+    for key in keys:
+        if key == last:
+            continue
+        last = key
+        found = False
+        for k, keys_ in enumerate(excluded):
+            while heads[k] is not None and heads[k] < key:
+                heads[k] = next(keys_, None)
+            found = found or heads[k] == key
+        if not found:
+            yield key
+
+
+def _noting_goals(keys, goals):
+    """Yield <keys>, appending the first goal state among them to <goals>."""
+    for key in keys:
+        if not goals and is_goal_packed(key):
+            goals.append(key)
+        yield key
+
+
+class _LayerFile:
+    """Membership tests against a layer file, by binary search over its memory map."""
+
+    def __init__(self, filename):
+        self._file = open(filename, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self._key_bytes = hrd.STATE_BYTES
+        self._keys = KeyView(self._mmap, 0, size // self._key_bytes, self._key_bytes)
+
+    def __contains__(self, key):
+        packed = key.to_bytes(self._key_bytes, 'big')
+        index = bisect_left(self._keys, packed)
+        return index < len(self._keys) and self._keys[index] == packed
+
+    def close(self):
+        if self._mmap:
+            self._mmap.close()
+        self._file.close()
+
+
+def _backtrack(start, levels, goal_key, depth):
+    """Return the path from <start> to the state with canonical key <goal_key>, <depth> moves away.
+
+    <levels> maps every depth to the files holding the keys of that depth. Each
+    step looks for a neighbour of the current key one depth lower, then the
+    canonical keys are turned back into the states actually visited.
+    """
+    keys = [goal_key]
+    for d in range(depth - 1, -1, -1):
+        files = [_LayerFile(filename) for filename in levels[d]]
+        try:
+            keys.append(next(canonical_key(s) for s in get_successors_packed(keys[-1])
+                             if any(canonical_key(s) in f for f in files)))
+        finally:
+            for f in files:
+                f.close()
+    keys.reverse()
+    path = [start]
+    for key in keys[1:]:
+        path.append(next(s for s in get_successors_packed(path[-1]) if canonical_key(s) == key))
+    return path
+
+
+def search_external(start, max_memory=1 << 28, directory=None, stats=None, handover=None):
+    """Return a shortest path from the packed state <start> to a goal, or None.
+
+    Breadth-first search that keeps its layers in sorted files under
+    <directory> (the system temporary directory by default) and holds at most
+    about <max_memory> bytes of generated keys in memory at a time. A search
+    handed over from memory passes <handover>, a list of the (canonical key, g)
+    pairs of the states it expanded and the (g, state) pairs it left open, which
+    are carried on from instead of <start>. The list is emptied, and what it
+    refers to dropped once it is on disk, so the memory of the search that
+    handed over is freed.
+    """
+    hook, every = (None, 1) if stats is None else (stats.hook, stats.every)
+    began = time.perf_counter()
+    capacity = max(1024, max_memory // BYTES_PER_KEY)
+    expanded = generated = discovered = peak = 0
+    with tempfile.TemporaryDirectory(prefix='hrd-', dir=directory) as workdir:
+        try:
+            if is_goal_packed(start):
+                return [start]
+            closed, frontier = handover or ((), [(0, start)])
+            if handover:
+                handover.clear()
+            # the files holding the keys of every depth: its closed states and its layer
+            levels = {}
+            for moves, filename in _spill_closed(workdir, closed, capacity).items():
+                levels[moves] = [filename]
+            pending = os.path.join(workdir, 'pending')
+            depth = _spill_seeds(workdir, pending, frontier, capacity)
+            closed = frontier = None
+            if depth is None:
+                return None
+            layer = None
+            while True:
+                runs = []
+                buffer = []
+                if layer is not None:
+                    if stats is not None:
+                        stats.f_progression.append([depth - 1, expanded])
+                    for key in _read_keys(layer):
+                        expanded += 1
+                        if hook is not None and not expanded % every:
+                            hook(key, expanded)
+                        for successor in get_successors_packed(key):
+                            buffer.append(canonical_key(successor))
+                        if len(buffer) >= capacity:
+                            generated += len(buffer)
+                            runs.append(os.path.join(workdir, f'run-{depth}-{len(runs)}'))
+                            _write_keys(runs[-1], sorted(set(buffer)))
+                            buffer = []
+                generated += len(buffer)
+                buffer = sorted(set(buffer))
+                joining = (key for key, moves in _read_seeds(pending) if moves == depth)
+                merged = heapq.merge(buffer, joining, *(_read_keys(run) for run in runs))
+                previous = [_read_keys(filename) for d in (depth - 2, depth - 1) for filename in levels.get(d, ())]
+                previous += [_read_keys(filename) for filename in levels.get(depth, ())]
+                layer = os.path.join(workdir, f'layer-{depth}')
+                goals = []
+                size = _write_keys(layer, _noting_goals(_fresh(merged, *previous), goals))
+                levels.setdefault(depth, []).append(layer)
+                for run in runs:
+                    os.remove(run)
+                discovered += size
+                peak = max(peak, size)
+                if goals:
+                    return _backtrack(start, levels, goals[0], depth)
+                # Drop the seeds this layer joined or reached before their g.
+                remaining = os.path.join(workdir, 'pending-next')
+                seeded = _write_seeds(remaining, _seeds_after(_read_seeds(pending), depth, _read_keys(layer)))
+                os.replace(remaining, pending)
+                if not size and seeded is None:
+                    return None
+                depth += 1
+        finally:
+            if stats is not None:
+                stats.add(expanded, generated, generated - discovered, peak, time.perf_counter() - began)
+
+
+def solve_within(algo, start, max_memory, directory=None, stats=None, **options):
+    """Solve <start> with <algo>, switching to search_external once the process outgrows <max_memory> bytes.
+
+    The resident set size is checked whenever the search calls its stats hook,
+    every MEMORY_CHECK_EVERY expansions unless a hook of its own asks for more.
+    Once it is over budget, astar hands its closed and open states over and the
+    search carries on from them on disk; any other search is dropped and the
+    board is solved again, from scratch, by external-memory BFS. Only this
+    process is measured, so hdastar, whose states live in worker processes,
+    raises ValueError. So do dfs with a depth limit and awastar with a time
+    budget, since external-memory BFS would honour neither.
+    """
+    if algo == 'hdastar':
+        raise ValueError("a memory budget only measures this process, not the worker processes of hdastar")
+    if algo == 'dfs' and options.get('depth_limit') is not None:
+        raise ValueError("a memory budget would finish dfs by BFS, which has no depth limit")
+    if algo == 'awastar' and options.get('time_budget') is not None:
+        raise ValueError("a memory budget would finish awastar by BFS, which has no time budget")
+    if algo == 'extbfs':
+        return search_external(start, max_memory, directory, stats)
+    stats = stats if stats is not None else SearchStats()
+    hook, every = stats.hook, stats.every
+
+    def watch(state, expanded):
+        if hook is not None:
+            hook(state, expanded)
+        if current_memory() > max_memory:
+            raise MemoryBudgetExceeded()
+
+    stats.hook, stats.every = watch, every if hook is not None else MEMORY_CHECK_EVERY
+    try:
+        return solve(algo, start, stats=stats, **options)
+    except MemoryBudgetExceeded as e:
+        # Held in a list search_external empties, so nothing here keeps astar's states alive.
+        handover = None if e.frontier is None else [e.closed, e.frontier]
+    finally:
+        stats.hook, stats.every = hook, every
+    return search_external(start, max_memory, directory, stats, handover)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a puzzle by breadth-first search with layers kept on disk.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="The input file that contains the puzzle."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The output file that contains the solution."
+    )
+    parser.add_argument(
+        "--max-memory",
+        type=parse_size,
+        default='256M',
+        help="The memory the search may hold keys in, such as 64M or 2G."
+    )
+    parser.add_argument(
+        "--directory",
+        type=str,
+        default=None,
+        help="Where layer files are kept; defaults to the system temporary directory."
+    )
+    args = parser.parse_args()
+    try:
+        grid = load_puzzle(args.inputfile)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    run_search('extbfs', grid, args.outputfile, max_memory=args.max_memory, spill_directory=args.directory)
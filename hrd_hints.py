@@ -0,0 +1,179 @@
+import argparse
+import heapq
+import time
+from itertools import count
+
+from hrd import (add_search_arguments, canonical_key, decode_state, display_grid, encode_grid, follow_mirrored_links,
+                 get_successors_packed, is_goal_packed, load_heuristic, mirror_state, read_boards, use_board,
+                 validate_grid)
+
+# A hint session answers "what is the best next move from here?" for a player
+# working through one puzzle. Every state on a solution it has found keeps its
+# exact distance to the goal and its next state, so a board on a known path is
+# answered by a lookup. Any other board is searched by A* that stops at the
+# first known state it takes off the open list, and after each search the
+# heuristic of every state it expanded is raised to C* - g, as in adaptive A*:
+# no path from the searched board through that state is shorter than C*, so the
+# estimate stays admissible while steering later searches straight back to the
+# known paths.
+
+
+class HintSession:
+    """Optimal hints for consecutive boards of one game, reusing earlier searches.
+
+    A SearchStats given as <stats> accumulates the work of every search the
+    session runs.
+    """
+
+    def __init__(self, heuristic='manhattan', pdb_file=None, stats=None):
+        self.heuristic = heuristic
+        self.pdb_file = pdb_file
+        self.stats = stats
+        self._h = None
+        # canonical key -> exact number of moves to a goal
+        self._exact = {}
+        # canonical key -> (state, the state after it on a shortest path)
+        self._next = {}
+        # canonical key -> a lower bound learned from an earlier search
+        self._learned = {}
+        # canonical keys of states from which no goal can be reached
+        self._unsolvable = set()
+
+    def _estimate(self, state, key):
+        exact = self._exact.get(key)
+        if exact is not None:
+            return exact
+        return max(self._h(state), self._learned.get(key, 0))
+
+    def _remember(self, path):
+        """Record the exact distances and next states along <path>, which ends at a goal."""
+        for k, state in enumerate(path):
+            key = canonical_key(state)
+            self._exact[key] = len(path) - 1 - k
+            if k + 1 < len(path):
+                self._next[key] = (state, path[k + 1])
+
+    def _known_path(self, state):
+        """Return the remembered path from <state>, which has an exact distance, to a goal."""
+        # Goals have no next state, which ends the chain.
+        return follow_mirrored_links(lambda s: self._next.get(canonical_key(s), (None, None)), state)
+
+    def _search(self, start):
+        """A* from <start> to a goal or known state; return the whole path to a goal, or None."""
+        if self._h is None:
+            self._h = load_heuristic(self.heuristic, start, self.pdb_file)
+        began = time.perf_counter()
+        hook, every = (None, 1) if self.stats is None else (self.stats.hook, self.stats.every)
+        start_key = canonical_key(start)
+        # canonical key -> (g, the state reached, the state it was reached from)
+        nodes = {start_key: (0, start, None)}
+        closed = {}
+        tie = count()
+        queue = [(self._estimate(start, start_key), 0, next(tie), start)]
+        expanded = generated = duplicates = peak = 0
+        found = None
+        try:
+            while queue:
+                f, neg_moves, _, curr = heapq.heappop(queue)
+                key = canonical_key(curr)
+                moves = -neg_moves
+                if nodes[key][0] < moves:
+                    continue
+                if key in self._exact or is_goal_packed(curr):
+                    found = curr
+                    break
+                closed[key] = moves
+                expanded += 1
+                if hook is not None and not expanded % every:
+                    hook(curr, expanded)
+                successors = get_successors_packed(curr)
+                generated += len(successors)
+                for successor in successors:
+                    key = canonical_key(successor)
+                    if key in self._unsolvable or nodes.get(key, (moves + 2,))[0] <= moves + 1:
+                        duplicates += 1
+                        continue
+                    # Learned estimates need not be consistent, so a state reached
+                    # again in fewer moves is opened again even if it was expanded.
+                    nodes[key] = (moves + 1, successor, curr)
+                    heapq.heappush(queue, (moves + 1 + self._estimate(successor, key), -moves - 1,
+                                           next(tie), successor))
+                if len(queue) > peak:
+                    peak = len(queue)
+        finally:
+            if self.stats is not None:
+                self.stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+        if found is None:
+            self._unsolvable.update(closed)
+            return None
+        path = follow_mirrored_links(lambda s: nodes[canonical_key(s)][1:], found)
+        path.reverse()
+        if path[0] != start:
+            path = [mirror_state(state) for state in path]
+        path += self._known_path(path[-1])[1:]
+        cost = len(path) - 1
+        for key, moves in closed.items():
+            if cost - moves > self._learned.get(key, 0):
+                self._learned[key] = cost - moves
+        self._remember(path)
+        return path
+
+    def solution(self, state):
+        """Return a shortest path from the packed state <state> to a goal, or None if there is none."""
+        key = canonical_key(state)
+        if key in self._unsolvable:
+            return None
+        if is_goal_packed(state):
+            return [state]
+        if key in self._exact:
+            return self._known_path(state)
+        return self._search(state)
+
+    def distance(self, state):
+        """Return the fewest moves from <state> to a goal, or None if there is no way there."""
+        path = self.solution(state)
+        return None if path is None else len(path) - 1
+
+    def hint(self, state):
+        """Return the state after <state> on a shortest path, or None if it is solved or unsolvable."""
+        key = canonical_key(state)
+        if key in self._next:
+            recorded, successor = self._next[key]
+            return successor if recorded == state else mirror_state(successor)
+        path = self.solution(state)
+        return path[1] if path is not None and len(path) > 1 else None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write the best next move for every board of a game.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="The boards of a game in play order, separated by blank lines."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file the hinted boards are written to; solved and unsolvable boards are copied."
+    )
+    add_search_arguments(parser, table_file=False)
+    args = parser.parse_args()
+    # The first board sets the geometry every later board of the game must share.
+    try:
+        boards, goal = read_boards(args.inputfile)
+        if boards:
+            use_board(boards[0], goal)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    session = HintSession(heuristic=args.heuristic, pdb_file=args.pdb_file)
+    with open(args.outputfile, 'w') as f:
+        for grid in boards:
+            try:
+                validate_grid(grid)
+            except ValueError as e:
+                parser.error(f"{args.inputfile}: {e}")
+            state = encode_grid(grid)
+            successor = session.hint(state)
+            f.write(display_grid(decode_state(state if successor is None else successor)) + '\n')
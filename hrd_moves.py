@@ -0,0 +1,139 @@
+import argparse
+
+from hrd import (CELL_BITS, CELL_MASK, check_geometry, display_state, encode_grid, geometry, get_successors_packed,
+                 parse_cell, set_geometry, write_solution)
+
+# A move list stores the goal position and the start board once, in the usual
+# puzzle file text, followed by one token per move: the first cell the moving
+# piece vacates, in base 36, and the direction it slides, one of U, D, L and R.
+# Tokens have a fixed width and are written without separators, so on the 4x5
+# board a move takes two bytes where a grid takes 26.
+MAGIC = 'HRD-MOVES 2'
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+TOKENS_PER_LINE = 32
+
+
+def _cells():
+    width, height, _, _ = geometry()
+    return width * height
+
+
+def _cell_width():
+    width = 1
+    while len(DIGITS) ** width < _cells():
+        width += 1
+    return width
+
+
+def _format_cell(cell):
+    text = ''
+    for _ in range(_cell_width()):
+        cell, digit = divmod(cell, len(DIGITS))
+        text = DIGITS[digit] + text
+    return text
+
+
+def _empty_cells(state):
+    return [k for k in range(_cells()) if not state >> (CELL_BITS * k) & CELL_MASK]
+
+
+def move_token(state, successor):
+    """Return the token of the single slide taking <state> to <successor>."""
+    before = set(_empty_cells(state))
+    after = set(_empty_cells(successor))
+    vacated = min(after - before)
+    filled = min(before - after)
+    width = geometry()[0]
+    if filled // width == vacated // width:
+        direction = 'R' if filled > vacated else 'L'
+    else:
+        direction = 'D' if filled > vacated else 'U'
+    return _format_cell(vacated) + direction
+
+
+def apply_token(state, token):
+    """Return the state <token> leads to from <state>; raises ValueError if it names no legal move."""
+    for successor in get_successors_packed(state):
+        if move_token(state, successor) == token:
+            return successor
+    raise ValueError(f"{token!r} is not a legal move")
+
+
+def write_moves(path, output_file):
+    """Write <path> to <output_file> as a start board and a move list."""
+    with open(output_file, 'w', buffering=1 << 16) as f:
+        if not path:
+            return
+        _, _, goal_row, goal_col = geometry()
+        f.write(f"{MAGIC}\n# goal {goal_row} {goal_col}\n{display_state(path[0])}\n")
+        tokens = [move_token(state, successor) for state, successor in zip(path, path[1:])]
+        for k in range(0, len(tokens), TOKENS_PER_LINE):
+            f.write(''.join(tokens[k:k + TOKENS_PER_LINE]) + '\n')
+
+
+def _read(filename):
+    """Return the start grid, the goal position and the token lines of the move list in <filename>.
+
+    An empty file, written for a board without a solution, gives None.
+    """
+    with open(filename) as f:
+        lines = [line.strip() for line in f]
+    if not lines or not any(lines):
+        return None
+    if lines[0] != MAGIC or len(lines) < 2 or not lines[1].startswith('# goal '):
+        raise ValueError(f"{filename} is not a move list")
+    goal = parse_cell(lines[1][len('# goal '):])
+    blank = lines.index('', 2)
+    return [list(row) for row in lines[2:blank]], goal, lines[blank + 1:]
+
+
+def read_geometry(filename):
+    """Return the (width, height, goal row, goal column) the move list in <filename> was written for."""
+    read = _read(filename)
+    if read is None:
+        return geometry()
+    grid, goal, _ = read
+    return (len(grid[0]), len(grid)) + goal
+
+
+def read_moves(filename):
+    """Replay the move list in <filename> and return the packed states of its path.
+
+    Raises ValueError if the list was written for another board geometry.
+    """
+    read = _read(filename)
+    if read is None:
+        return []
+    grid, goal, lines = read
+    check_geometry(filename, (len(grid[0]), len(grid)) + goal)
+    state = encode_grid(grid)
+    path = [state]
+    width = _cell_width() + 1
+    for line in lines:
+        for k in range(0, len(line), width):
+            state = apply_token(state, line[k:k + width])
+            path.append(state)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a move list into one grid per move.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="The move list written with --output-format moves."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The file the grids are written to."
+    )
+    args = parser.parse_args()
+    try:
+        set_geometry(*read_geometry(args.inputfile))
+        path = read_moves(args.inputfile)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    write_solution(path, args.outputfile)
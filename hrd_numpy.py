@@ -0,0 +1,122 @@
+import time
+
+import numpy as np
+
+import hrd
+from hrd import CELL_BITS, MIRROR_TABLE_WIDTH, canonical_key, geometry, get_successors_packed, mirror_state
+
+# The move table flattened into parallel arrays, (masks, bits, deltas, mirrored
+# rows) by geometry: a layer is expanded by one vectorized test-and-apply per
+# slide rather than per state.
+_TABLES = {}
+
+
+def _tables():
+    """Return the arrays of the geometry in play, building them on first use.
+
+    Raises ValueError for boards whose states do not fit a uint64 or whose rows
+    are too wide to reflect by table lookup.
+    """
+    board = geometry()
+    if board not in _TABLES:
+        if hrd.CELLS * CELL_BITS > 64:
+            raise ValueError(f"npbfs needs boards of at most {64 // CELL_BITS} cells")
+        if hrd._MIRROR_ROW is None:
+            raise ValueError(f"npbfs needs boards at most {MIRROR_TABLE_WIDTH} cells wide")
+        slides = [slide for entries in hrd._MOVES.values() for _, by_code in entries
+                  for moves in by_code.values() for slide in moves]
+        _TABLES[board] = (np.array([mask for mask, _, _ in slides], dtype=np.uint64),
+                          np.array([bits for _, bits, _ in slides], dtype=np.uint64),
+                          np.array([delta for _, _, delta in slides], dtype=np.uint64),
+                          np.array(hrd._MIRROR_ROW, dtype=np.uint64))
+    return _TABLES[board]
+
+
+def canonical_keys(states):
+    """Vectorized canonical_key over a uint64 array."""
+    if not hrd.SYMMETRIC:
+        return states
+    mirror_row = _tables()[3]
+    row_mask = np.uint64(hrd.ROW_MASK)
+    mirrored = np.zeros_like(states)
+    for i in range(hrd.HEIGHT):
+        shift = np.uint64(hrd.ROW_BITS * i)
+        mirrored |= mirror_row[(states >> shift) & row_mask] << shift
+    return np.minimum(states, mirrored)
+
+
+def expand_layer(layer, stats=None):
+    """Return the sorted, distinct canonical keys one slide away from <layer>."""
+    masks, bits, deltas, _ = _tables()
+    successors = np.concatenate([(layer[(layer & mask) == match] ^ delta)
+                                 for mask, match, delta in zip(masks, bits, deltas)])
+    unique = np.unique(canonical_keys(successors))
+    if stats is not None:
+        stats.add(len(layer), len(successors), len(successors) - len(unique))
+    return unique
+
+
+def _contains(sorted_keys, keys):
+    """Return a boolean array marking which <keys> occur in the sorted array <sorted_keys>."""
+    if not len(sorted_keys):
+        return np.zeros(len(keys), dtype=bool)
+    index = np.searchsorted(sorted_keys, keys)
+    index[index == len(sorted_keys)] = 0
+    return sorted_keys[index] == keys
+
+
+def enumerate_layers(start, stop_at_goal=False, stats=None):
+    """Return the breadth-first layers of canonical keys reachable from <start>.
+
+    Every layer is a sorted uint64 array. Moves are reversible, so a state one
+    slide away from layer d lies in layer d - 1, d or d + 1, and only the last
+    two layers are needed to weed out states seen before. With <stop_at_goal>,
+    enumeration stops after the first layer that holds a goal state. Raises
+    ValueError on boards _tables cannot handle.
+    """
+    _tables()
+    layers = [np.array([canonical_key(start)], dtype=np.uint64)]
+    previous = np.zeros(0, dtype=np.uint64)
+    while len(layers[-1]):
+        if stop_at_goal and np.any((layers[-1] & np.uint64(hrd.GOAL_MASK)) == np.uint64(hrd.GOAL_BITS)):
+            break
+        current = layers[-1]
+        if stats is not None:
+            stats.f_progression.append([len(layers) - 1, stats.expanded])
+            # A layer is expanded in one go, so the hook sees its first state
+            # whenever the layer carries the count past a multiple of every.
+            expanded = stats.expanded + len(current)
+            if stats.hook is not None and expanded // stats.every > stats.expanded // stats.every:
+                stats.hook(int(current[0]), expanded)
+        successors = expand_layer(current, stats)
+        fresh = ~(_contains(current, successors) | _contains(previous, successors))
+        previous = current
+        layers.append(successors[fresh])
+        if stats is not None:
+            stats.add(0, 0, len(successors) - len(layers[-1]), len(layers[-1]))
+    if not len(layers[-1]):
+        layers.pop()
+    return layers
+
+
+def search_bfs_numpy(start, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None."""
+    began = time.perf_counter()
+    layers = enumerate_layers(start, stop_at_goal=True, stats=stats)
+    if stats is not None:
+        stats.add(0, 0, seconds=time.perf_counter() - began)
+    last = layers[-1]
+    goals = last[(last & np.uint64(hrd.GOAL_MASK)) == np.uint64(hrd.GOAL_BITS)]
+    if not len(goals):
+        return None
+    # Walk back through the layers, each time stepping to a neighbour one layer closer to the start.
+    state = int(goals[0])
+    path = [state]
+    for layer in reversed(layers[:-1]):
+        state = next(s for s in get_successors_packed(state)
+                     if _contains(layer, np.array([canonical_key(s)], dtype=np.uint64))[0])
+        path.append(state)
+    path.reverse()
+    if path[0] != start:
+        path = [mirror_state(state) for state in path]
+    return path
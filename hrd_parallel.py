@@ -0,0 +1,296 @@
+import argparse
+import heapq
+import multiprocessing
+import os
+import queue
+import time
+from itertools import count
+
+from hrd import (add_search_arguments, canonical_key, follow_mirrored_links, geometry, get_successors_packed,
+                 is_goal_packed, load_heuristic, load_puzzle, mirror_state, run_search, set_geometry)
+
+# Hash-distributed A* (HDA*): every state belongs to one worker, chosen by a
+# hash of its canonical key, and only that worker keeps its g, its parent and
+# its place in an open list. Workers run asynchronously: each expands up to
+# <batch> states, sends the successors it generated for other workers straight
+# to their owners' queues and takes in whatever has arrived in its own. The
+# coordinator only broadcasts the best solution length found so far, which
+# workers prune against, and detects termination: once every worker is idle,
+# with nothing below that length left open, and every batch sent has been
+# received, no better solution can turn up.
+BATCH = 64
+# Seconds the coordinator, and an idle worker, wait for a message before looking around again.
+POLL = 0.001
+# Fields of each worker's slice of the shared counters. SENT and RECEIVED
+# count batches between workers, REPORTED the goals reported to the coordinator.
+SENT, RECEIVED, REPORTED, IDLE, EXPANDED, OPEN, LOWEST = range(7)
+FIELDS = 7
+# The incumbent and LOWEST of a search without one.
+NONE = -1
+
+
+def owner(key, workers):
+    """Return the index of the worker that owns the state with canonical key <key>."""
+    # Fibonacci hashing: neighbouring boards differ in a few low fields, which
+    # the multiplication spreads over the high bits used here.
+    return ((key * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF) * workers >> 64
+
+
+class _Partition:
+    """The states owned by one worker: their g, parent, open list and closed set."""
+
+    def __init__(self, workers, h):
+        self.workers = workers
+        self.h = h
+        self.best_g = {}
+        # parent and the instance among a state and its mirror image that the
+        # parent links refer to, by canonical key
+        self.parents = {}
+        self.instances = {}
+        self.closed = set()
+        self.queue = []
+        self.tie = count()
+        self.expanded = self.generated = self.duplicates = self.peak = 0
+
+    def receive(self, messages, goals):
+        """Take in (state, g, f, parent) messages, adding any goal reached to <goals>."""
+        for state, moves, f, parent in messages:
+            key = canonical_key(state)
+            if self.best_g.get(key, moves + 1) <= moves:
+                self.duplicates += 1
+                continue
+            instance = self.instances.setdefault(key, state)
+            if parent is not None and instance != state:
+                parent = mirror_state(parent)
+            self.parents[key] = parent
+            self.best_g[key] = moves
+            if is_goal_packed(state):
+                goals.append((moves, instance))
+                continue
+            # A state reached again with a lower g is expanded again.
+            self.closed.discard(key)
+            heapq.heappush(self.queue, (f, -moves, next(self.tie), moves, key))
+        self.peak = max(self.peak, len(self.queue))
+
+    def _clean(self):
+        while self.queue and (self.queue[0][4] in self.closed or self.queue[0][3] != self.best_g[self.queue[0][4]]):
+            heapq.heappop(self.queue)
+
+    def expand(self, limit, incumbent, outboxes):
+        """Expand up to <limit> open states with f below <incumbent>, adding the messages to <outboxes> by owner.
+
+        Returns the number of states expanded.
+        """
+        for expanded in range(limit):
+            self._clean()
+            if not self.has_work(incumbent):
+                return expanded
+            _, _, _, moves, key = heapq.heappop(self.queue)
+            self.closed.add(key)
+            curr = self.instances[key]
+            self.expanded += 1
+            successors = get_successors_packed(curr)
+            self.generated += len(successors)
+            for successor in successors:
+                f = moves + 1 + self.h(successor)
+                if incumbent is None or f < incumbent:
+                    outboxes[owner(canonical_key(successor), self.workers)].append((successor, moves + 1, f, curr))
+        self._clean()
+        return limit
+
+    def has_work(self, incumbent):
+        return bool(self.queue) and (incumbent is None or self.queue[0][0] < incumbent)
+
+    def lowest_f(self):
+        return self.queue[0][0] if self.queue else None
+
+
+def _worker(index, workers, board, start, heuristic, pdb_file, batch, inboxes, reports, counters, incumbent, done,
+            conn):
+    """Search one partition of the <board> geometry until <done>, then answer the coordinator's requests.
+
+    Batches for other workers go to their <inboxes>, goals reached to
+    <reports>; every batch and report is counted in <counters> before it is
+    sent and every batch arrived is counted as this worker stops being idle.
+    """
+    set_geometry(*board)
+    partition = _Partition(workers, load_heuristic(heuristic, start, pdb_file))
+    inbox = inboxes[index]
+    slots = index * FIELDS
+    arrived = []
+    while not done.value:
+        try:
+            while True:
+                arrived.append(inbox.get_nowait())
+        except queue.Empty:
+            pass
+        if arrived:
+            with counters.get_lock():
+                counters[slots + IDLE] = 0
+                counters[slots + RECEIVED] += len(arrived)
+        goals = []
+        for messages in arrived:
+            partition.receive(messages, goals)
+        arrived = []
+        best = None if incumbent.value == NONE else incumbent.value
+        outboxes = [[] for _ in range(workers)]
+        expanded = partition.expand(batch, best, outboxes)
+        partition.receive(outboxes[index], goals)
+        outboxes[index] = []
+        sends = [(inboxes[k], messages) for k, messages in enumerate(outboxes) if messages]
+        lowest = partition.lowest_f()
+        with counters.get_lock():
+            counters[slots + SENT] += len(sends)
+            counters[slots + REPORTED] += len(goals)
+            counters[slots + EXPANDED] = partition.expanded
+            counters[slots + OPEN] = len(partition.queue)
+            counters[slots + LOWEST] = NONE if lowest is None else lowest
+        for owner_inbox, messages in sends:
+            owner_inbox.put(messages)
+        for goal in goals:
+            reports.put(goal)
+        if expanded or partition.has_work(best):
+            continue
+        with counters.get_lock():
+            counters[slots + IDLE] = 1
+        try:
+            arrived.append(inbox.get(timeout=POLL))
+        except queue.Empty:
+            pass
+    conn.send((partition.expanded, partition.generated, partition.duplicates, partition.peak))
+    while True:
+        request = conn.recv()
+        if request[0] == 'parent':
+            conn.send((partition.instances[request[1]], partition.parents[request[1]]))
+        else:
+            conn.close()
+            return
+
+
+def search_hdastar(start, workers=None, heuristic='manhattan', pdb_file=None, batch=BATCH, stats=None):
+    """Return a shortest path from the packed state <start> to a goal, or None.
+
+    Runs A* on <workers> processes, defaulting to one per core, each owning the
+    states that hash to it.
+    """
+    if is_goal_packed(start):
+        return [start]
+    began = time.perf_counter()
+    workers = workers or os.cpu_count()
+    context = multiprocessing.get_context('spawn')
+    inboxes = [context.Queue() for _ in range(workers)]
+    reports = context.Queue()
+    counters = context.Array('q', FIELDS * workers)
+    incumbent = context.RawValue('q', NONE)
+    done = context.RawValue('b', 0)
+    conns, processes = [], []
+    for index in range(workers):
+        ours, theirs = context.Pipe()
+        process = context.Process(target=_worker, args=(index, workers, geometry(), start, heuristic, pdb_file, batch,
+                                                        inboxes, reports, counters, incumbent, done, theirs),
+                                  daemon=True)
+        process.start()
+        theirs.close()
+        conns.append(ours)
+        processes.append(process)
+    first = owner(canonical_key(start), workers)
+    counters[first * FIELDS + SENT] = 1
+    inboxes[first].put([(start, 0, 0, None)])
+    best, goal = None, None
+    taken = expanded = generated = duplicates = peak = 0
+    hook, every = (None, 1) if stats is None else (stats.hook, stats.every)
+    try:
+        while True:
+            try:
+                moves, state = reports.get(timeout=POLL)
+                taken += 1
+                if best is None or moves < best:
+                    best, goal = moves, state
+                    incumbent.value = best
+                continue
+            except queue.Empty:
+                pass
+            with counters.get_lock():
+                snapshot = counters[:]
+            fields = [snapshot[field::FIELDS] for field in range(FIELDS)]
+            if (all(fields[IDLE]) and sum(fields[SENT]) == sum(fields[RECEIVED])
+                    and sum(fields[REPORTED]) == taken):
+                break
+            reported, expanded = expanded, sum(fields[EXPANDED])
+            peak = max(peak, sum(fields[OPEN]))
+            lower = min((f for f in fields[LOWEST] if f != NONE), default=None)
+            if stats is not None and lower is not None and (not stats.f_progression or
+                                                            lower > stats.f_progression[-1][0]):
+                stats.f_progression.append([lower, expanded])
+            if hook is not None and expanded // every > reported // every:
+                hook(start, expanded)
+        done.value = 1
+        expanded = generated = duplicates = 0
+        for conn in conns:
+            counts = conn.recv()
+            expanded += counts[0]
+            generated += counts[1]
+            duplicates += counts[2]
+            peak = max(peak, counts[3])
+        if goal is None:
+            return None
+
+        # Walk the parent links back to the start, asking each state's owner.
+        def link(state):
+            key = canonical_key(state)
+            conn = conns[owner(key, workers)]
+            conn.send(('parent', key))
+            return conn.recv()
+
+        path = follow_mirrored_links(link, goal)
+        path.reverse()
+        if path[0] != start:
+            path = [mirror_state(state) for state in path]
+        return path
+    finally:
+        done.value = 1
+        for conn in conns:
+            try:
+                conn.send(('stop',))
+            except OSError:
+                pass
+        for process in processes:
+            process.join(1)
+            if process.is_alive():
+                process.terminate()
+        if stats is not None:
+            stats.add(expanded, generated, duplicates, peak, time.perf_counter() - began)
+
+
+def run_hdastar(grid, output_file, workers=None, heuristic='manhattan', pdb_file=None):
+    """Solve <grid> with hash-distributed A* on <workers> processes."""
+    return run_search('hdastar', grid, output_file, heuristic=heuristic, pdb_file=pdb_file, workers=workers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Solve a puzzle with A* spread over several processes.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="The input file that contains the puzzle."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The output file that contains the solution."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes; defaults to the number of cores."
+    )
+    add_search_arguments(parser, table_file=False)
+    args = parser.parse_args()
+    try:
+        grid = load_puzzle(args.inputfile)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    run_hdastar(grid, args.outputfile, workers=args.workers, heuristic=args.heuristic, pdb_file=args.pdb_file)
@@ -0,0 +1,234 @@
+import argparse
+import mmap
+import struct
+from bisect import bisect_left
+from functools import lru_cache, partial
+from itertools import combinations, product
+
+import hrd
+from hrd import (CELL_BITS, CELL_MASK, DOWN, EMPTY, GOAL, LEFT, RIGHT, SINGLE, UP, KeyView, _cells_with_code,
+                 check_geometry, encode_grid, geometry, get_successors_packed, iter_goal_states, load_puzzle,
+                 mirror_state, piece_counts)
+
+# A pattern keeps the goal piece plus some families of pieces; every other piece
+# is cut into 1x1 blockers, which slide for free. A move of a piece outside the
+# pattern is one or two blocker slides, so any move sequence of the real puzzle
+# is still legal in the abstraction, costing only its moves of pattern pieces,
+# and the abstract distance is an admissible lower bound on the real one.
+# Blockers go on filling their cells, so pattern pieces still wait for the few
+# blanks to reach them. Blockers are written as single pieces, which is why no
+# pattern keeps SINGLE.
+PATTERNS = {
+    'vertical': (GOAL, UP, DOWN),
+    'horizontal': (GOAL, LEFT, RIGHT),
+    'dominoes': (GOAL, UP, DOWN, LEFT, RIGHT),
+}
+
+MAGIC = b'HRDPDB\x03\x00'
+HEADER = struct.Struct('<8sHHHHHH')    # magic, width, height, goal row, goal column, key bytes, table count
+TABLE = struct.Struct('<16sIBBB')      # pattern name, entries, singles, verticals, horizontals
+MAX_DISTANCE = 255
+# Abstract states repeat constantly during a search, so each table remembers the
+# distances of the abstract states it looked up most recently, up to this many.
+MEMO_SIZE = 1 << 16
+
+
+def abstract_state(state, codes):
+    """Cut every piece of <state> whose code is not in <codes> into 1x1 blockers."""
+    keep = 0
+    for code in codes:
+        keep |= _cells_with_code(state, code)
+    occupied = hrd.LOW_BITS & ~_cells_with_code(state, EMPTY)
+    return state & (keep * CELL_MASK) | (occupied & ~keep) * SINGLE
+
+
+def pattern_counts(state, pattern):
+    """Return the piece_counts of the abstraction of <state> for <pattern>, blockers counting as singles."""
+    return piece_counts(abstract_state(state, PATTERNS[pattern]))
+
+
+@lru_cache(maxsize=None)
+def _inner_cells(width, height):
+    """Return the masks of the cells off the first column and off the last column of a <width> by <height> board."""
+    first = sum(1 << (CELL_BITS * width * i) for i in range(height))
+    low_bits = sum(1 << (CELL_BITS * k) for k in range(width * height))
+    return low_bits & ~first, low_bits & ~(first << (CELL_BITS * (width - 1)))
+
+
+def _regions(free):
+    """Yield the connected regions of the cells in the mask <free>."""
+    off_first, off_last = _inner_cells(hrd.WIDTH, hrd.HEIGHT)
+    while free:
+        region = free & -free
+        while True:
+            grown = (region | region << CELL_BITS & off_first | region >> CELL_BITS & off_last
+                     | region << hrd.ROW_BITS | region >> hrd.ROW_BITS) & free
+            if grown == region:
+                break
+            region = grown
+        yield region
+        free &= ~region
+
+
+def _settle(state):
+    """Return the abstract state with the blanks of every blocker region of <state> on its lowest cells.
+
+    Blockers are alike, so those of a region can be slid into any order at no
+    cost, and the states that differ only in that order share one distance.
+    """
+    empty = _cells_with_code(state, EMPTY)
+    free = empty | _cells_with_code(state, SINGLE)
+    settled = state & ~(free * CELL_MASK)
+    for region in _regions(free):
+        for _ in range((region & empty).bit_count()):
+            region &= region - 1
+        settled |= region * SINGLE
+    return settled
+
+
+def abstract_key(state):
+    """Return the key shared by the abstract <state>, the states its blockers slide into and their mirror images."""
+    settled = _settle(state)
+    if not hrd.SYMMETRIC:
+        return settled
+    return min(settled, _settle(mirror_state(settled)))
+
+
+def _arrangements(state):
+    """Yield every state the blockers of the abstract <state> can be slid into at no cost."""
+    empty = _cells_with_code(state, EMPTY)
+    free = empty | _cells_with_code(state, SINGLE)
+    fixed = state & ~(free * CELL_MASK)
+    choices = []
+    for region in _regions(free):
+        cells = []
+        rest = region
+        while rest:
+            cells.append(rest & -rest)
+            rest &= rest - 1
+        choices.append([region & ~sum(blanks) for blanks in combinations(cells, (region & empty).bit_count())])
+    for blockers in product(*choices):
+        yield fixed | sum(blockers) * SINGLE
+
+
+def build_table(counts, pattern):
+    """Return {abstract key: distance to goal} for one pattern.
+
+    Runs a breadth-first search backwards from every abstract goal state over
+    the moves of pattern pieces, blocker slides being free; moves are
+    reversible, so this yields the exact abstract distance of every abstract
+    state that can still reach the goal.
+    """
+    frontier = list({abstract_key(state) for state in iter_goal_states(counts)})
+    distances = dict.fromkeys(frontier, 0)
+    depth = 0
+    while frontier:
+        depth += 1
+        layer = []
+        for state in frontier:
+            for arrangement in _arrangements(state):
+                blockers = _cells_with_code(arrangement, SINGLE)
+                for successor in get_successors_packed(arrangement):
+                    if _cells_with_code(successor, SINGLE) != blockers:
+                        # a blocker slid, which leaves the abstract state as it was
+                        continue
+                    key = abstract_key(successor)
+                    if key not in distances:
+                        distances[key] = min(depth, MAX_DISTANCE)
+                        layer.append(key)
+        frontier = layer
+    return distances
+
+
+def write_database(filename, tables):
+    """Write <tables>, a list of (pattern, counts, distances), to <filename>."""
+    key_bytes = hrd.STATE_BYTES
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, *geometry(), key_bytes, len(tables)))
+        for pattern, counts, distances in tables:
+            f.write(TABLE.pack(pattern.encode(), len(distances), counts[SINGLE], counts[UP], counts[LEFT]))
+        for _, _, distances in tables:
+            keys = sorted(distances)
+            f.write(b''.join(key.to_bytes(key_bytes, 'big') for key in keys))
+            f.write(bytes(distances[key] for key in keys))
+
+
+class PatternDatabase:
+    """A pattern database file, memory-mapped rather than read into memory."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, width, height, goal_row, goal_col, key_bytes, n_tables = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a pattern database")
+        check_geometry(filename, (width, height, goal_row, goal_col), key_bytes)
+        self._key_bytes = key_bytes
+        self.tables = []
+        offset = HEADER.size + n_tables * TABLE.size
+        for t in range(n_tables):
+            name, entries, singles, verticals, horizontals = TABLE.unpack_from(self._mmap, HEADER.size + t * TABLE.size)
+            pattern = name.rstrip(b'\0').decode()
+            counts = {SINGLE: singles, UP: verticals, LEFT: horizontals}
+            keys = KeyView(self._mmap, offset, entries, key_bytes)
+            offset += entries * key_bytes
+            distance = lru_cache(maxsize=MEMO_SIZE)(partial(self._distance, keys, offset))
+            self.tables.append((pattern, counts, PATTERNS[pattern], distance))
+            offset += entries
+
+    def check(self, state):
+        """Raise ValueError unless every table was built for the pieces of <state>."""
+        for pattern, counts, _, _ in self.tables:
+            if pattern_counts(state, pattern) != counts:
+                raise ValueError(f"the {pattern} pattern database was built for a different piece set")
+
+    def _distance(self, keys, values, state):
+        packed = abstract_key(state).to_bytes(self._key_bytes, 'big')
+        index = bisect_left(keys, packed)
+        return self._mmap[values + index] if index < len(keys) and keys[index] == packed else 0
+
+    def lookup(self, table, state):
+        """Return the abstract distance of <state> in <table>, or 0 if it is not listed."""
+        _, _, codes, distance = table
+        return distance(abstract_state(state, codes))
+
+    def heuristic(self, state):
+        """Admissible estimate of the moves left from <state>: the largest pattern distance."""
+        return max(self.lookup(table, state) for table in self.tables)
+
+    def close(self):
+        # The memos of the tables refer back to this database.
+        self.tables = []
+        self._mmap.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build pattern databases for the piece set of a puzzle.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="A puzzle whose piece set the database is built for."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The database file to write."
+    )
+    parser.add_argument(
+        "--pattern",
+        action="append",
+        choices=sorted(PATTERNS),
+        help="A pattern to include; may be repeated. Defaults to all patterns."
+    )
+    args = parser.parse_args()
+    try:
+        start = encode_grid(load_puzzle(args.inputfile))
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    tables = []
+    for pattern in args.pattern or sorted(PATTERNS):
+        counts = pattern_counts(start, pattern)
+        tables.append((pattern, counts, build_table(counts, pattern)))
+    write_database(args.outputfile, tables)
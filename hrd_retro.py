@@ -0,0 +1,144 @@
+import argparse
+import mmap
+import struct
+import time
+from bisect import bisect_left
+
+import hrd
+from hrd import (KeyView, canonical_key, check_geometry, encode_grid, geometry, get_successors_packed, is_goal_packed,
+                 load_puzzle, run_search)
+
+# A retrograde table lists every state of one connected component that can reach
+# the goal, with its exact distance to the nearest goal state. Solving a board of
+# that component is then a walk downhill through the table.
+MAGIC = b'HRDRET\x02\x00'
+HEADER = struct.Struct('<8sHHHHHxxI')  # magic, width, height, goal row, goal column, key bytes, entries
+DISTANCE = struct.Struct('<H')
+
+
+def enumerate_component(start):
+    """Return the canonical keys of every state reachable from <start>."""
+    component = {canonical_key(start): start}
+    frontier = [start]
+    while frontier:
+        layer = []
+        for state in frontier:
+            for successor in get_successors_packed(state):
+                key = canonical_key(successor)
+                if key not in component:
+                    component[key] = successor
+                    layer.append(successor)
+        frontier = layer
+    return component
+
+
+def build_distances(start):
+    """Return {canonical key: distance to goal} for the component of <start>.
+
+    Runs a breadth-first search backwards from every goal state of the
+    component; moves are reversible, so predecessors are just successors.
+    """
+    component = enumerate_component(start)
+    frontier = [state for state in component.values() if is_goal_packed(state)]
+    distances = {canonical_key(state): 0 for state in frontier}
+    depth = 0
+    while frontier:
+        depth += 1
+        layer = []
+        for state in frontier:
+            for successor in get_successors_packed(state):
+                key = canonical_key(successor)
+                if key not in distances:
+                    distances[key] = depth
+                    layer.append(successor)
+        frontier = layer
+    return distances
+
+
+def write_table(filename, distances):
+    keys = sorted(distances)
+    key_bytes = hrd.STATE_BYTES
+    with open(filename, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, *geometry(), key_bytes, len(keys)))
+        f.write(b''.join(key.to_bytes(key_bytes, 'big') for key in keys))
+        f.write(b''.join(DISTANCE.pack(distances[key]) for key in keys))
+
+
+class DistanceTable:
+    """A retrograde table file, memory-mapped rather than read into memory."""
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, width, height, goal_row, goal_col, key_bytes, entries = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{filename} is not a retrograde table")
+        check_geometry(filename, (width, height, goal_row, goal_col), key_bytes)
+        self._filename = filename
+        self._key_bytes = key_bytes
+        self._keys = KeyView(self._mmap, HEADER.size, entries, key_bytes)
+        self._values = HEADER.size + entries * key_bytes
+
+    def __len__(self):
+        return len(self._keys)
+
+    def distance(self, state):
+        """Return the exact number of moves from <state> to the goal, or None if it is not listed."""
+        key = canonical_key(state).to_bytes(self._key_bytes, 'big')
+        index = bisect_left(self._keys, key)
+        if index < len(self._keys) and self._keys[index] == key:
+            return DISTANCE.unpack_from(self._mmap, self._values + index * DISTANCE.size)[0]
+        return None
+
+    def solve(self, state, stats=None):
+        """Return a shortest path from <state> to the goal.
+
+        Raises ValueError if <state> is not listed: the table was built for
+        another component, or for one from which the goal cannot be reached.
+        """
+        distance = self.distance(state)
+        if distance is None:
+            raise ValueError(f"{self._filename} does not list this board, which is outside the component it was "
+                             f"built for or cannot reach the goal")
+        began = time.perf_counter()
+        path = [state]
+        generated = 0
+        while distance:
+            distance -= 1
+            successors = get_successors_packed(state)
+            generated += len(successors)
+            state = next(s for s in successors if self.distance(s) == distance)
+            path.append(state)
+        if stats is not None:
+            stats.add(len(path) - 1, generated, peak_frontier=1, seconds=time.perf_counter() - began)
+        return path
+
+    def close(self):
+        self._mmap.close()
+
+
+def run_retro(grid, output_file, table_file):
+    """Solve <grid> by walking downhill through the retrograde table in <table_file>."""
+    return run_search('retro', grid, output_file, table_file=table_file)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the retrograde distance table of a puzzle's component.")
+    parser.add_argument(
+        "--inputfile",
+        type=str,
+        required=True,
+        help="A puzzle of the component to enumerate."
+    )
+    parser.add_argument(
+        "--outputfile",
+        type=str,
+        required=True,
+        help="The table file to write."
+    )
+    args = parser.parse_args()
+    try:
+        start = encode_grid(load_puzzle(args.inputfile))
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
+    write_table(args.outputfile, build_distances(start))
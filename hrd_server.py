@@ -0,0 +1,298 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections.abc import Hashable
+from concurrent.futures import ProcessPoolExecutor
+from itertools import count
+from multiprocessing.util import Finalize
+
+from hrd import (ALGORITHMS, OUTPUT_FORMATS, DepthLimitReached, SearchStats, add_search_arguments, close_tables,
+                 display_state, encode_grid, geometry, parse_cell, set_geometry, solve, use_board)
+from hrd_cache import SolutionCache, is_limited
+from hrd_moves import move_token
+
+# Workers look for cancellation and deadlines from the search hook, once every
+# this many expansions; that keeps the check off the hot path but still stops a
+# search within a few milliseconds.
+CHECK_EVERY = 1024
+# Seconds a cancelled ticket is remembered, long enough for any worker running it to notice.
+CANCEL_GRACE = 60
+SEARCH_OPTIONS = ('heuristic', 'pdb_file', 'table_file', 'tt_size', 'time_budget', 'depth_limit', 'iterative')
+
+
+def _start_worker():
+    """Close the tables a worker process keeps open for its searches when it exits."""
+    Finalize(None, close_tables, exitpriority=0)
+
+
+class SolveCancelled(Exception):
+    pass
+
+
+class SolveTimeout(Exception):
+    pass
+
+
+def _solve_job(ticket, start, algo, deadline, cancelled, board, options):
+    """Run one search in a worker process, giving up once <ticket> is cancelled or <deadline> seconds pass.
+
+    The worker plays on <board>, the geometry() of the request.
+    """
+    set_geometry(*board)
+    stop = None if deadline is None else time.monotonic() + deadline
+
+    def check(state, expanded):
+        if stop is not None and time.monotonic() > stop:
+            raise SolveTimeout()
+        if ticket in cancelled:
+            raise SolveCancelled()
+
+    return solve(algo, start, stats=SearchStats(hook=check, every=CHECK_EVERY), **options)
+
+
+class _StdinReader:
+    """The part of asyncio.StreamReader serve() uses, over sys.stdin.
+
+    Lines are read on a thread, which unlike a pipe transport also works when
+    stdin is a regular file.
+    """
+
+    async def readline(self):
+        return await asyncio.get_running_loop().run_in_executor(None, sys.stdin.buffer.readline)
+
+
+class _StdoutWriter:
+    """The parts of asyncio.StreamWriter serve() uses, over sys.stdout."""
+
+    def write(self, data):
+        sys.stdout.buffer.write(data)
+
+    async def drain(self):
+        sys.stdout.buffer.flush()
+
+    def close(self):
+        pass
+
+
+class SolverServer:
+    """Answers puzzle requests with warm caches, running searches on a process pool.
+
+    A request is a JSON object with an "id", the "grid" rows and optionally the
+    "goal" of the 2x2 piece written as 'ROW,COL', the "algo", a "deadline" in
+    seconds, "format" ('grids' or 'moves'), "hint" to get only the next grid,
+    and the options solve() takes. The board size is that of the grid.
+    {"cancel": id} cancels an earlier request of the same connection. Every
+    request gets one response carrying its id and a status of solved,
+    unsolvable, limited (no solution within the depth limit), timeout,
+    cancelled or error; a request reusing the id of one still in flight is
+    answered with an error straight away.
+    """
+
+    def __init__(self, workers=None, cache_file=None, capacity=4096, algo='astar', **options):
+        self.algo = algo
+        self.options = options
+        self.cache = SolutionCache(capacity=capacity, filename=cache_file)
+        # Spawned rather than forked workers, so they do not inherit, and hold
+        # open, the sockets of the connections being served when they start.
+        context = multiprocessing.get_context('spawn')
+        # Each worker keeps the pattern databases and retrograde tables it opens
+        # for every later request; see hrd.open_table.
+        self._pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(), mp_context=context,
+                                         initializer=_start_worker)
+        self._manager = context.Manager()
+        # tickets of the searches to stop, shared with the workers
+        self._cancelled = self._manager.dict()
+        self._tickets = count()
+
+    async def solve(self, request, ticket=None):
+        """Return the response to one puzzle request."""
+        response = {'id': request.get('id')}
+        try:
+            algo = request.get('algo', self.algo)
+            if algo not in ALGORITHMS:
+                raise ValueError(f"unknown algorithm {algo!r}")
+            output_format = request.get('format', 'grids')
+            if output_format not in OUTPUT_FORMATS:
+                raise ValueError(f"unknown output format {output_format!r}")
+            grid = [list(row) for row in request['grid']]
+            use_board(grid, parse_cell(request['goal']) if 'goal' in request else None)
+            start = encode_grid(grid)
+            path = await self._search(algo, start, geometry(), request,
+                                      next(self._tickets) if ticket is None else ticket)
+        except DepthLimitReached:
+            response['status'] = 'limited'
+            return response
+        except SolveTimeout:
+            response['status'] = 'timeout'
+            return response
+        except (SolveCancelled, asyncio.CancelledError):
+            response['status'] = 'cancelled'
+            return response
+        except Exception as e:
+            response.update(status='error', error=str(e))
+            return response
+        if path is None:
+            response['status'] = 'unsolvable'
+            return response
+        response.update(status='solved', moves=len(path) - 1)
+        if request.get('hint'):
+            path = path[:2]
+        if output_format == 'moves':
+            response['solution'] = ''.join(move_token(state, successor) for state, successor in zip(path, path[1:]))
+        else:
+            response['solution'] = [display_state(state) for state in path]
+        return response
+
+    async def _search(self, algo, start, board, request, ticket):
+        """Return the path from <start> on <board>, from the cache or a worker.
+
+        Other requests may play on other boards while the worker searches, so
+        <board> is played on again before the path is cached and returned.
+        """
+        options = dict(self.options)
+        options.update((name, request[name]) for name in SEARCH_OPTIONS if name in request)
+        cached = not is_limited(algo, options)
+        iterative = options.get('iterative', False)
+        if cached:
+            try:
+                return self.cache.get(algo, start, iterative=iterative)
+            except KeyError:
+                pass
+        deadline = request.get('deadline')
+        future = asyncio.get_running_loop().run_in_executor(
+            self._pool, _solve_job, ticket, start, algo, deadline, self._cancelled, board, options)
+        try:
+            path = await asyncio.wait_for(future, deadline)
+        except asyncio.TimeoutError:
+            raise SolveTimeout()
+        finally:
+            if future.cancelled():
+                # The worker may already be searching; make its next check stop it.
+                self._cancelled[ticket] = True
+                asyncio.get_running_loop().call_later(CANCEL_GRACE, self._cancelled.pop, ticket, None)
+        set_geometry(*board)
+        if cached:
+            self.cache.put(algo, start, path, iterative=iterative)
+        return path
+
+    async def serve(self, reader, writer):
+        """Answer the JSON-line requests read from <reader> until it is exhausted."""
+        # the answer being worked out for every request in flight, by ticket
+        tasks = {}
+        # the ticket of the request in flight under each id, for cancelling it
+        tickets = {}
+
+        async def answer(ticket, request_id, request):
+            try:
+                response = await self.solve(request, ticket)
+            finally:
+                del tasks[ticket]
+                if request_id is not None:
+                    del tickets[request_id]
+            writer.write(json.dumps(response).encode() + b'\n')
+            await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                writer.write(json.dumps({'id': None, 'status': 'error', 'error': str(e)}).encode() + b'\n')
+                continue
+            if not isinstance(request, dict):
+                error = f"a request is a JSON object, not {line.decode().strip()!r}"
+                writer.write(json.dumps({'id': None, 'status': 'error', 'error': error}).encode() + b'\n')
+                continue
+            if not all(isinstance(request.get(name), Hashable) for name in ('id', 'cancel')):
+                error = "a request id is a JSON string, number, boolean or null"
+                writer.write(json.dumps({'id': None, 'status': 'error', 'error': error}).encode() + b'\n')
+                continue
+            if 'cancel' in request:
+                if request['cancel'] in tickets:
+                    tasks[tickets[request['cancel']]].cancel()
+                continue
+            request_id = request.get('id')
+            if request_id is not None and request_id in tickets:
+                error = f"request {request_id!r} is already in flight"
+                writer.write(json.dumps({'id': request_id, 'status': 'error', 'error': error}).encode() + b'\n')
+                continue
+            ticket = next(self._tickets)
+            if request_id is not None:
+                tickets[request_id] = ticket
+            tasks[ticket] = asyncio.ensure_future(answer(ticket, request_id, request))
+        if tasks:
+            await asyncio.gather(*tasks.values(), return_exceptions=True)
+        writer.close()
+
+    def close(self):
+        self._pool.shutdown(cancel_futures=True)
+        self._manager.shutdown()
+        self.cache.close()
+        close_tables()
+
+
+async def serve_stdio(server):
+    await server.serve(_StdinReader(), _StdoutWriter())
+
+
+async def serve_unix(server, path):
+    listener = await asyncio.start_unix_server(server.serve, path=path)
+    async with listener:
+        await listener.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve puzzle requests as JSON lines, keeping caches warm.")
+    parser.add_argument(
+        "--socket",
+        type=str,
+        default=None,
+        help="A Unix socket to listen on; requests are read from stdin when omitted."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="The number of worker processes; defaults to the number of cores."
+    )
+    parser.add_argument(
+        "--algo",
+        type=str,
+        default='astar',
+        choices=ALGORITHMS,
+        help="The searching algorithm of requests that do not name one."
+    )
+    parser.add_argument(
+        "--cache-file",
+        type=str,
+        default=None,
+        help="An SQLite file solutions are cached in across restarts."
+    )
+    parser.add_argument(
+        "--capacity",
+        type=int,
+        default=4096,
+        help="The number of solutions kept in memory."
+    )
+    add_search_arguments(parser)
+    args = parser.parse_args()
+    server = SolverServer(workers=args.workers, cache_file=args.cache_file, capacity=args.capacity,
+                          algo=args.algo, heuristic=args.heuristic, pdb_file=args.pdb_file,
+                          table_file=args.table_file)
+    try:
+        if args.socket:
+            asyncio.run(serve_unix(server, args.socket))
+        else:
+            asyncio.run(serve_stdio(server))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
@@ -1,14 +1,17 @@
-from copy import deepcopy
 from heapq import heappush, heappop
-import time
+from itertools import count
 import argparse
-import sys
-from adts import Stack
+
+from hrd import read_puzzle
 
 # ====================================================================================
 
 char_goal = '1'
 char_single = '2'
+char_empty = '.'
+
+# The slides a piece can make, as (dx, dy).
+directions = ((0, -1), (0, 1), (-1, 0), (1, 0))
 
 
 class Piece:
@@ -16,6 +19,8 @@ class Piece:
     This represents a piece on the Hua Rong Dao puzzle.
     """
 
+    __slots__ = ('is_goal', 'is_single', 'coord_x', 'coord_y', 'orientation')
+
     def __init__(self, is_goal, is_single, coord_x, coord_y, orientation):
         """
         :param is_goal: True if the piece is the goal piece and False otherwise.
@@ -50,22 +55,55 @@ class Piece:
         """
         self.coord_y, self.coord_x = j, i
 
+    def cells(self):
+        """Return the (x, y, symbol) of every cell the piece covers."""
+        x, y = self.coord_x, self.coord_y
+        if self.is_goal:
+            return (x, y, char_goal), (x + 1, y, char_goal), (x, y + 1, char_goal), (x + 1, y + 1, char_goal)
+        if self.is_single:
+            return (x, y, char_single),
+        if self.orientation == 'h':
+            return (x, y, '<'), (x + 1, y, '>')
+        return (x, y, '^'), (x, y + 1, 'v')
+
+    def covers(self, x, y):
+        """Return True if the piece covers the cell <x, y>."""
+        width = 2 if self.is_goal or self.orientation == 'h' else 1
+        height = 2 if self.is_goal or self.orientation == 'v' else 1
+        return self.coord_x <= x < self.coord_x + width and self.coord_y <= y < self.coord_y + height
+
 
 class Board:
     """
     Board class for setting up the playing board.
+
+    A board is built once per search. Moves are made in place with apply() and
+    taken back with undo(), which only rewrite the cells of the moving piece.
     """
 
-    def __init__(self, pieces):
+    def __init__(self, pieces, width=4, height=5, goal_x=None, goal_y=None):
         """
         :param pieces: The list of Pieces
         :type pieces: List[Piece]
+        :param width: The number of columns of the board.
+        :type width: int
+        :param height: The number of rows of the board.
+        :type height: int
+        :param goal_x: The x coordinate of the top left corner of the goal piece once solved,
+            by default the middle of the board.
+        :type goal_x: Optional[int]
+        :param goal_y: The y coordinate of the top left corner of the goal piece once solved,
+            by default two rows above the bottom.
+        :type goal_y: Optional[int]
         """
 
-        self.width = 4
-        self.height = 5
+        self.width = width
+        self.height = height
+        self.goal_x = (width - 2) // 2 if goal_x is None else goal_x
+        self.goal_y = height - 2 if goal_y is None else goal_y
 
         self.pieces = pieces
+        self.goal = next((piece for piece in pieces if piece.is_goal), None)
 
         # self.grid is a 2-d (size * size) array automatically generated
         # using the information on the pieces when a board is being created.
@@ -82,36 +120,85 @@ class Board:
         for i in range(self.height):
             line = []
             for j in range(self.width):
-                line.append('.')
+                line.append(char_empty)
             self.grid.append(line)
 
         for piece in self.pieces:
-            if piece.is_goal:
-                self.grid[piece.coord_y][piece.coord_x] = char_goal
-                self.grid[piece.coord_y][piece.coord_x + 1] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x] = char_goal
-                self.grid[piece.coord_y + 1][piece.coord_x + 1] = char_goal
-            elif piece.is_single:
-                self.grid[piece.coord_y][piece.coord_x] = char_single
-            else:
-                if piece.orientation == 'h':
-                    self.grid[piece.coord_y][piece.coord_x] = '<'
-                    self.grid[piece.coord_y][piece.coord_x + 1] = '>'
-                elif piece.orientation == 'v':
-                    self.grid[piece.coord_y][piece.coord_x] = '^'
-                    self.grid[piece.coord_y + 1][piece.coord_x] = 'v'
+            self._place(piece)
+
+    def _place(self, piece):
+        for x, y, ch in piece.cells():
+            self.grid[y][x] = ch
+
+    def _lift(self, piece):
+        for x, y, _ in piece.cells():
+            self.grid[y][x] = char_empty
+
+    def can_move(self, index, dx, dy):
+        """Return True if piece <index> can slide by <dx, dy>."""
+        piece = self.pieces[index]
+        for x, y, _ in piece.cells():
+            x, y = x + dx, y + dy
+            if not (0 <= x < self.width and 0 <= y < self.height):
+                return False
+            if self.grid[y][x] != char_empty and not piece.covers(x, y):
+                return False
+        return True
+
+    def moves(self):
+        """Return the legal moves of the board as (piece index, dx, dy)."""
+        return [(index, dx, dy) for index in range(len(self.pieces)) for dx, dy in directions
+                if self.can_move(index, dx, dy)]
+
+    def apply(self, move):
+        """Make the legal move <move> in place."""
+        index, dx, dy = move
+        piece = self.pieces[index]
+        self._lift(piece)
+        piece.move(piece.coord_x + dx, piece.coord_y + dy)
+        self._place(piece)
+
+    def undo(self, move):
+        """Take back <move>, the last move applied."""
+        index, dx, dy = move
+        self.apply((index, -dx, -dy))
+
+    def key(self):
+        """Return the grid as a string; boards that only swap alike pieces share it."""
+        return ''.join([''.join(line) for line in self.grid])
+
+    def positions(self):
+        """Return the coordinates of every piece, flattened into one tuple."""
+        return tuple([v for piece in self.pieces for v in (piece.coord_x, piece.coord_y)])
+
+    def set_positions(self, positions):
+        """Move the pieces to <positions>, as returned by positions(), rewriting only the cells of pieces that move."""
+        moved = [piece for k, piece in enumerate(self.pieces)
+                 if (piece.coord_x, piece.coord_y) != positions[2 * k:2 * k + 2]]
+        if not moved:
+            return
+        for piece in moved:
+            self._lift(piece)
+        for k, piece in enumerate(self.pieces):
+            if piece in moved:
+                piece.move(positions[2 * k], positions[2 * k + 1])
+                self._place(piece)
+
+    def __str__(self):
+        return ''.join([''.join(line) + '\n' for line in self.grid])
 
     def display(self):
         """
         Print out the current board.
 
         """
-        for i, line in enumerate(self.grid):
-            for ch in line:
-                print(ch, end='')
-            print()
+        print(self, end='')
+
 
 
+# Breaks ties between states of equal f, first generated first.
+_ids = count()
+
 
 class State:
     """
@@ -119,43 +206,57 @@ class State:
     Note that State and Board are different. Board has the locations of the pieces. 
     State has a Board and some extra information that is relevant to the search: 
     heuristic function, f value, current depth and parent.
+
+    Every state of a search shares one Board; a state only records the
+    positions of the pieces, which the board is moved back to when the state
+    is expanded.
     """
 
-    def __init__(self, board, f=None, depth=None, parent=None):
+    __slots__ = ('board', 'positions', 'f', 'depth', 'parent', 'id')
+
+    def __init__(self, board, f=None, depth=0, parent=None):
         """
         :param board: The board of the state.
         :type board: Board
         :param f: The f value of current state, initialized to None.
         :type f: Optional[int]
-        :param depth: The depth of current state in the search tree, initialized to None.
-        :type depth: Optional[int]
+        :param depth: The depth of current state in the search tree, initialized to 0.
+        :type depth: int
         :param parent: The parent of current state.
         :type parent: Optional[State]
         """
         self.board = board
+        self.positions = board.positions()
         self.f = f
         self.depth = depth
         self.parent = parent
-        self.id = hash(board)  # The id for breaking ties.
+        self.id = next(_ids)  # The id for breaking ties.
+
+    def restore(self):
+        """Move the shared board to this state and return it."""
+        self.board.set_positions(self.positions)
+        return self.board
 
 
-def is_goal(grid):
+def is_goal(grid, goal_x=None, goal_y=None):
     """
     Return true if this grid is in the goal state.
 
     :param: grid
     :type: List
+    :param goal_x, goal_y: The top left corner of the goal position, by default
+        as for Board.
     :rtype bool
     """
-    pass
-
-
-def _get_vert_successors(grid, i, j):
-    pass
+    goal_x = (len(grid[0]) - 2) // 2 if goal_x is None else goal_x
+    goal_y = len(grid) - 2 if goal_y is None else goal_y
+    return (grid[goal_y][goal_x] == grid[goal_y][goal_x + 1] == char_goal
+            and grid[goal_y + 1][goal_x] == grid[goal_y + 1][goal_x + 1] == char_goal)
 
 
-def _get_horiz_successors(grid, i, j):
-    pass
+def manhattan(board):
+    """Return the Manhattan distance of the goal piece of <board> from its goal position."""
+    return abs(board.goal.coord_x - board.goal_x) + abs(board.goal.coord_y - board.goal_y)
 
 
 def _get_point_successors(grid, i, j):
@@ -223,38 +324,95 @@ def _get_point_successors(grid, i, j):
     return successors
 
 
-
-def get_successors(grid):
+def get_successors(state):
     """
+    Return the states one move away from <state>.
 
-    :param board:
-    :type Board
+    The board is left as <state> has it.
+
+    :param state:
+    :type State
     :rtype list
     """
+    board = state.restore()
     successors = []
-    for i in range(5):
-        for j in range(4):
-            if grid[i][j] == '.':
-                successors += _get_point_successors(grid, i, j)
-                if i != 4 and board.grid[i + 1][j] == '.':
-                    return successors + _get_vert_successors(grid, i, j)
-                elif board.grid[i][j + 1] == '.':
-                    return successors + _get_horiz_successors(grid, i, j)
-                
-                
+    for move in board.moves():
+        board.apply(move)
+        successors.append(State(board, depth=state.depth + 1, parent=state))
+        board.undo(move)
+    return successors
+
+
+def _trace(state, moves):
+    """Return the state reached by making <moves> from <state>, with one State per move on its parent chain."""
+    board = state.restore()
+    for move in moves:
+        board.apply(move)
+        state = State(board, depth=state.depth + 1, parent=state)
+    return state
 
 
 def run_dfs(state):
-    frontier = Stack(state)
-    while not frontier.is_empty():
-        curr = frontier.pop()
-        if is_goal(curr.board):
-            return curr
-        frontier.add_lst(get_successors(curr.board))
+    """
+    Return a goal state reachable from <state>, or None.
+
+    Depth-first search making and taking back moves on the one board; only the
+    moves along the current path are kept.
+    """
+    board = state.restore()
+    if is_goal(board.grid, board.goal_x, board.goal_y):
+        return state
+    seen = {board.key()}
+    path = []
+    frames = [iter(board.moves())]
+    while frames:
+        move = next(frames[-1], None)
+        if move is None:
+            frames.pop()
+            if path:
+                board.undo(path.pop())
+            continue
+        board.apply(move)
+        key = board.key()
+        if key in seen:
+            board.undo(move)
+            continue
+        seen.add(key)
+        path.append(move)
+        if is_goal(board.grid, board.goal_x, board.goal_y):
+            return _trace(state, path)
+        frames.append(iter(board.moves()))
     return None
 
+
 def run_astar(state):
-    pass
+    """
+    Return a goal state at the fewest moves from <state>, or None.
+
+    A* with the Manhattan distance of the goal piece; the board is moved from
+    one expanded state to the next instead of being rebuilt.
+    """
+    board = state.restore()
+    state.f = state.depth + manhattan(board)
+    best = {board.key(): state.depth}
+    frontier = [(state.f, state.id, board.key(), state)]
+    while frontier:
+        _, _, key, curr = heappop(frontier)
+        if best[key] < curr.depth:
+            continue
+        board = curr.restore()
+        if is_goal(board.grid, board.goal_x, board.goal_y):
+            return curr
+        depth = curr.depth + 1
+        for move in board.moves():
+            board.apply(move)
+            key = board.key()
+            if best.get(key, depth + 1) > depth:
+                best[key] = depth
+                child = State(board, depth + manhattan(board), depth, curr)
+                heappush(frontier, (child.f, child.id, key, child))
+            board.undo(move)
+    return None
 
 
 def run_search(algorithm, board):
@@ -262,57 +420,63 @@ def run_search(algorithm, board):
 
     :param algorithm:
     :param board:
-    :rtype: Board
+    :rtype: Optional[State]
     """
     inp_state = State(board)
     if algorithm == "dfs":
-        run_dfs(inp_state)
-    else:
-        run_astar(inp_state)
-        
+        return run_dfs(inp_state)
+    return run_astar(inp_state)
+
 
 def read_from_file(filename):
     """
     Load initial board from a given file.
 
+    The board is as wide as its first row and as tall as its rows. A header
+    line '# goal ROW COL' sets the goal position of the goal piece; other lines
+    starting with '#' are comments.
+
     :param filename: The name of the given file.
     :type filename: str
     :return: A loaded board
     :rtype: Board
     """
 
-    puzzle_file = open(filename, "r")
+    grid, goal = read_puzzle(filename)
 
-    line_index = 0
     pieces = []
     g_found = False
 
-    for line in puzzle_file:
+    for y, row in enumerate(grid):
 
-        for x, ch in enumerate(line):
+        for x, ch in enumerate(row):
 
             if ch == '^':  # found vertical piece
-                pieces.append(Piece(False, False, x, line_index, 'v'))
+                pieces.append(Piece(False, False, x, y, 'v'))
             elif ch == '<':  # found horizontal piece
-                pieces.append(Piece(False, False, x, line_index, 'h'))
+                pieces.append(Piece(False, False, x, y, 'h'))
             elif ch == char_single:
-                pieces.append(Piece(False, True, x, line_index, None))
+                pieces.append(Piece(False, True, x, y, None))
             elif ch == char_goal:
                 if not g_found:
-                    pieces.append(Piece(True, False, x, line_index, None))
+                    pieces.append(Piece(True, False, x, y, None))
                     g_found = True
-        line_index += 1
 
-    puzzle_file.close()
-
-    board = Board(pieces)
+    goal_y, goal_x = goal or (None, None)
+    board = Board(pieces, len(grid[0]) if grid else 4, len(grid) or 5, goal_x, goal_y)
 
     return board
 
 
 def output_file(outputfile, output):
+    """Write every board on the path to the state <output>, if any, one grid per block."""
+    path = []
+    while output is not None:
+        path.append(output)
+        output = output.parent
     with open(f"{outputfile}.txt", "w") as file:
-        file.write(output.display())
+        for state in reversed(path):
+            file.write(str(state.restore()) + '\n')
 
 
 if __name__ == "__main__":
@@ -339,7 +503,10 @@ if __name__ == "__main__":
     args = parser.parse_args()
 
     # read the board from the file
-    board = read_from_file(args.inputfile)
+    try:
+        board = read_from_file(args.inputfile)
+    except ValueError as e:
+        parser.error(f"{args.inputfile}: {e}")
     # run specified algorithm on board
     output = run_search(args.algo, board)
     # write results to output file (create it if it is missing)
@@ -0,0 +1,600 @@
+import io
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import hrd
+import hrd_batch
+import hrd_bench
+import hrd_cache
+import hrd_corpus
+import hrd_external
+import hrd_hints
+import hrd_moves
+import hrd_parallel
+import hrd_pdb
+import hrd_retro
+import hrd_starter
+
+FIXTURES = os.path.dirname(__file__)
+
+
+def load(n):
+    return hrd.create_grid_from_file(os.path.join(FIXTURES, f"test-input-file-{n}"))
+
+
+def reachable(state, limit=2000):
+    seen = {state}
+    todo = [state]
+    while todo and len(seen) < limit:
+        for successor in hrd.get_successors_packed(todo.pop()):
+            if successor not in seen:
+                seen.add(successor)
+                todo.append(successor)
+    return seen
+
+
+def test_encode_decode_round_trip():
+    for n in (1, 2, 5, 6, 7):
+        grid = load(n)
+        assert hrd.decode_state(hrd.encode_grid(grid)) == grid
+
+
+def test_packed_successors_match_grid_successors():
+    for n in (1, 2, 5, 6, 7):
+        for state in reachable(hrd.encode_grid(load(n))):
+            grid = hrd.decode_state(state)
+            expected = sorted(hrd.display_grid(g) for g in hrd.get_successors(grid))
+            actual = sorted(hrd.display_state(s) for s in hrd.get_successors_packed(state))
+            assert actual == expected
+            assert hrd.is_goal_packed(state) == hrd.is_goal(grid)
+            assert hrd.get_manhattan_distance_packed(state) == hrd.get_manhattan_distance(grid)
+
+
+def read_solution(filename):
+    with open(filename) as f:
+        blocks = f.read().split('\n\n')
+    return [hrd.encode_grid([list(line) for line in block.split('\n')]) for block in blocks if block.strip()]
+
+
+def assert_valid_solution(path, start):
+    assert path[0] == start
+    assert hrd.is_goal_packed(path[-1])
+    for prev, curr in zip(path, path[1:]):
+        assert curr in hrd.get_successors_packed(prev)
+
+
+def test_searches_write_valid_solutions(tmp_path):
+    grid = load(5)
+    out = str(tmp_path / "out.txt")
+    for algo in ('dfs', 'astar', 'bibfs'):
+        assert hrd.is_goal(hrd.run_search(algo, grid, out))
+        assert_valid_solution(read_solution(out), hrd.encode_grid(grid))
+        if algo != 'dfs':
+            assert len(read_solution(out)) == 117
+
+
+def test_bibfs_matches_exact_distances(tmp_path):
+    start = hrd.encode_grid(load(6))
+    distances = hrd_retro.build_distances(start)
+    out = str(tmp_path / "out.txt")
+    for state in sorted(reachable(start, limit=300))[::30]:
+        assert hrd.run_bibfs(hrd.decode_state(state), out) is not None
+        path = read_solution(out)
+        assert_valid_solution(path, state)
+        assert len(path) - 1 == distances[hrd.canonical_key(state)]
+    assert hrd.run_bibfs(load(1), out) is None
+
+
+def test_canonical_key_folds_mirror_images():
+    state = hrd.encode_grid(load(6))
+    mirrored = hrd.mirror_state(state)
+    assert hrd.display_state(mirrored) == ''.join(
+        line[::-1].translate(str.maketrans('<>', '><')) + '\n' for line in hrd.display_state(state).split())
+    assert hrd.mirror_state(mirrored) == state
+    assert hrd.canonical_key(state) == hrd.canonical_key(mirrored)
+    assert sorted(map(hrd.canonical_key, hrd.get_successors_packed(mirrored))) == \
+        sorted(map(hrd.canonical_key, hrd.get_successors_packed(state)))
+
+
+def test_pattern_database_heuristic(tmp_path):
+    grid = load(5)
+    start = hrd.encode_grid(grid)
+    db_file = str(tmp_path / "hrd.pdb")
+    tables = []
+    for pattern in hrd_pdb.PATTERNS:
+        counts = hrd_pdb.pattern_counts(start, pattern)
+        tables.append((pattern, counts, hrd_pdb.build_table(counts, pattern)))
+    hrd_pdb.write_database(db_file, tables)
+    database = hrd_pdb.PatternDatabase(db_file)
+    database.check(start)
+    assert hrd.get_manhattan_distance_packed(start) < database.heuristic(start) <= 116
+    out = str(tmp_path / "out.txt")
+    hrd.run_astar(grid, out, heuristic='pdb', pdb_file=db_file)
+    path = read_solution(out)
+    assert_valid_solution(path, start)
+    assert len(path) == 117
+    assert all(database.heuristic(state) <= 116 - moves for moves, state in enumerate(path))
+    # Pieces outside a pattern still block it, so the database beats manhattan distance.
+    stats = {name: hrd.SearchStats() for name in ('manhattan', 'pdb')}
+    for name in stats:
+        hrd.search_astar(start, heuristic=name, pdb_file=db_file, stats=stats[name])
+    assert stats['pdb'].expanded < 0.85 * stats['manhattan'].expanded
+    assert all(table[3].cache_info().currsize <= hrd_pdb.MEMO_SIZE for table in database.tables)
+    # Searches share one open database, and its memos, until the file changes.
+    heuristic = hrd.load_heuristic('pdb', start, db_file)
+    assert hrd.load_heuristic('pdb', start, db_file).__self__ is heuristic.__self__
+    hrd_pdb.write_database(db_file, tables[:1])
+    rebuilt = hrd.load_heuristic('pdb', start, db_file).__self__
+    assert len(rebuilt.tables) == 1 and heuristic.__self__.tables == []
+    hrd.close_tables()
+    assert rebuilt.tables == []
+
+
+def test_retrograde_table_gives_optimal_paths(tmp_path):
+    grid = load(5)
+    start = hrd.encode_grid(grid)
+    table_file = str(tmp_path / "hrd.table")
+    hrd_retro.write_table(table_file, hrd_retro.build_distances(start))
+    table = hrd_retro.DistanceTable(table_file)
+    assert table.distance(start) == 116
+    path = table.solve(start)
+    assert_valid_solution(path, start)
+    assert table.solve(path[40]) == path[40:]
+    assert table.distance(hrd.encode_grid(load(6))) is None
+    out = str(tmp_path / "out.txt")
+    assert hrd.is_goal(hrd.run_search('retro', grid, out, table_file=table_file))
+    assert read_solution(out) == path
+    # A board outside the table's component is an error, not an unsolvable board.
+    with pytest.raises(ValueError, match="does not list"):
+        table.solve(hrd.encode_grid(load(6)))
+    table.close()
+    result = subprocess.run([sys.executable, os.path.join(os.path.dirname(FIXTURES), "hrd.py"), "--inputfile",
+                             os.path.join(FIXTURES, "test-input-file-6"), "--outputfile", out, "--algo", "retro",
+                             "--table-file", table_file], capture_output=True, text=True)
+    assert result.returncode == 2 and "does not list" in result.stderr
+
+
+def test_batch_streams_one_result_per_puzzle():
+    out = io.StringIO()
+    puzzles = hrd_batch.load_puzzles(os.path.join(FIXTURES, "test-input-file-[1257]"))
+    assert hrd_batch.run_batch(puzzles, 'bibfs', out, workers=2, timeout=30) == 2
+    results = {r['id'].rsplit('-', 1)[1]: r for r in map(json.loads, out.getvalue().splitlines())}
+    assert {n: r['status'] for n, r in results.items()} == \
+        {'1': 'unsolvable', '2': 'unsolvable', '5': 'solved', '7': 'solved'}
+    assert results['5']['moves'] == 116
+    assert results['7']['solution'][0] == hrd.display_grid(load(7))
+    assert hrd_batch.solve_puzzle('slow', load(6), 'dfs', timeout=0.001)['status'] == 'timeout'
+
+    # Puzzles are read from the source only as earlier ones finish.
+    read, read_by_result = [], []
+
+    def puzzles():
+        for n in range(12):
+            read.append(n)
+            yield n, load(7), None
+
+    class Recorder(io.StringIO):
+        def write(self, line):
+            read_by_result.append(len(read))
+            return super().write(line)
+
+    assert hrd_batch.run_batch(puzzles(), 'bibfs', Recorder(), workers=1) == 12
+    assert read_by_result[0] == hrd_batch.WINDOW
+
+
+def test_solution_cache_answers_states_on_cached_paths(tmp_path):
+    start = hrd.encode_grid(load(6))
+    db_file = str(tmp_path / "cache.db")
+    cache = hrd_cache.SolutionCache(capacity=4, filename=db_file)
+    path = cache.solve('astar', start)
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert cache.solve('bibfs', path[10]) == path[10:]
+    mirrored = hrd.mirror_state(path[20])
+    assert cache.get('astar', mirrored) == [hrd.mirror_state(s) for s in path[20:]]
+    unsolvable = hrd.encode_grid(load(1))
+    cache.put('dfs', unsolvable, None)
+    cache.close()
+
+    reopened = hrd_cache.SolutionCache(capacity=1, filename=db_file)
+    assert reopened.get('retro', path[30]) == path[30:]
+    assert reopened.get('dfs', unsolvable) is None
+    with pytest.raises(KeyError):
+        reopened.get('dfs', start)
+    assert len(reopened._paths) == 1
+    # A table without a board does not make that board unsolvable for the other algorithms.
+    table_file = str(tmp_path / "hrd.table")
+    hrd_retro.write_table(table_file, hrd_retro.build_distances(hrd.encode_grid(load(7))))
+    elsewhere = hrd.encode_grid(load(5))
+    with pytest.raises(ValueError, match="does not list"):
+        reopened.solve('retro', elsewhere, table_file=table_file)
+    with pytest.raises(KeyError):
+        reopened.get('astar', elsewhere)
+
+
+def test_idastar_finds_optimal_paths():
+    start = hrd.encode_grid(load(6))
+    path = hrd.search_bibfs(start)
+    for state in (path[-25], hrd.mirror_state(path[-12])):
+        solution = hrd.search_idastar(state, tt_size=1 << 10)
+        assert_valid_solution(solution, state)
+        assert len(solution) == len(hrd.search_bibfs(state))
+    assert hrd.search_idastar(hrd.encode_grid(load(1))) is None
+    assert hrd.search_idastar(hrd.encode_grid(load(2))) is None
+
+
+def test_numpy_bfs_matches_bibfs():
+    hrd_numpy = pytest.importorskip("hrd_numpy")
+    for n in (1, 5, 6):
+        start = hrd.encode_grid(load(n))
+        path = hrd_numpy.search_bfs_numpy(start)
+        expected = hrd.search_bibfs(start)
+        if expected is None:
+            assert path is None
+        else:
+            assert_valid_solution(path, start)
+            assert len(path) == len(expected)
+    start = hrd.encode_grid(load(7))
+    layers = hrd_numpy.enumerate_layers(start)
+    assert sum(map(len, layers)) == len(hrd_retro.enumerate_component(start))
+
+
+def test_benchmark_reports_and_compares():
+    puzzles = hrd_batch.load_puzzles(hrd_bench.CORPUS)
+    easy = [next(puzzles)]
+    report = hrd_bench.run_benchmark(easy, ['astar', 'dfs'], timeout=60)
+    astar, dfs = report['results']
+    assert astar['status'] == 'solved' and astar['moves'] == 4
+    assert astar['expanded'] <= astar['generated'] and astar['peak_rss_kb'] > 0
+    assert dfs['status'] == 'solved'
+    assert hrd_bench.compare(report, report) == []
+    slower = json.loads(json.dumps(report))
+    slower['results'][0].update(seconds=astar['seconds'] * 2 + 1, moves=5)
+    slower['results'][1].update(status='timeout')
+    assert len(hrd_bench.compare(report, slower)) == 3
+
+
+def test_search_stats_and_hook(tmp_path):
+    calls = []
+    stats = hrd.SearchStats(hook=lambda state, expanded: calls.append(expanded), every=100, timing=True)
+    hrd.run_search('astar', load(5), str(tmp_path / "out"), stats=stats)
+    assert stats.expanded == len(calls) * 100 + stats.expanded % 100
+    assert calls == list(range(100, stats.expanded + 1, 100))
+    assert stats.expanded + stats.duplicates <= stats.generated + 1
+    assert 0 < stats.peak_frontier < stats.generated
+    bounds = [f for f, _ in stats.f_progression]
+    assert bounds == sorted(bounds) and bounds[-1] == 116
+    assert abs(sum(stats.timings.values()) - stats.seconds) < 1e-6
+    fields = hrd.SearchStats().as_dict()
+    assert 'hook' not in fields and 'timings' not in fields
+
+
+def test_move_list_replays_to_the_same_grids(tmp_path):
+    for n in (1, 5, 6):
+        grids, moves, replayed = (str(tmp_path / name) for name in ("grids", "moves", "replayed"))
+        assert hrd.run_search('dfs', load(n), grids) == hrd.run_search('dfs', load(n), moves, output_format='moves')
+        hrd.write_solution(hrd_moves.read_moves(moves), replayed)
+        with open(grids) as f, open(replayed) as g:
+            assert f.read() == g.read()
+        assert os.path.getsize(moves) * 10 < os.path.getsize(grids) or n == 1
+    with pytest.raises(ValueError):
+        hrd_moves.apply_token(hrd.encode_grid(load(7)), '0U')
+
+
+def test_server_answers_cancels_and_times_out():
+    rows = lambda n: [''.join(row) for row in load(n)]
+    hard = ["^222", "v^11", "^v11", "v<>2", "<>.."]
+    requests = [
+        {'id': 'easy', 'grid': rows(7)},
+        {'id': 'moves', 'grid': rows(5), 'format': 'moves'},
+        {'id': 'cancelled', 'grid': hard, 'algo': 'idastar'},
+        {'cancel': 'cancelled'},
+        {'id': 'late', 'grid': hard, 'algo': 'idastar', 'deadline': 0.2},
+        {'id': 'none', 'grid': rows(2)},
+        {'id': 'hint', 'grid': rows(5), 'hint': True},
+        {'grid': rows(7)},
+        {'grid': rows(7)},
+        {'id': 'twice', 'grid': hard, 'algo': 'idastar', 'deadline': 0.5},
+        {'id': 'twice', 'grid': rows(7)},
+        {'id': 'limited', 'grid': rows(6), 'algo': 'dfs', 'depth_limit': 70},
+        {'id': 'unlimited', 'grid': rows(6), 'algo': 'dfs'},
+        [],
+        3,
+        {'cancel': []},
+        {'id': ['unhashable'], 'grid': rows(7)},
+        {'id': 'larger', 'grid': rows(8), 'goal': '4,1', 'format': 'moves'},
+    ]
+    server = os.path.join(os.path.dirname(FIXTURES), "hrd_server.py")
+    result = subprocess.run([sys.executable, server, "--workers", "2"], capture_output=True, text=True, timeout=60,
+                            input=''.join(json.dumps(request) + '\n' for request in requests))
+    answered = [json.loads(line) for line in result.stdout.splitlines()]
+    assert len(answered) == 17 and 'exception' not in result.stderr
+    assert [r['moves'] for r in answered if r['id'] is None and 'moves' in r] == [4, 4]
+    assert [r['status'] for r in answered if r['id'] is None and 'moves' not in r] == ['error'] * 4
+    assert sorted(r['status'] for r in answered if r['id'] == 'twice') == ['error', 'timeout']
+    responses = {response['id']: response for response in answered}
+    assert responses['easy']['moves'] == 4 and len(responses['easy']['solution']) == 5
+    assert len(responses['moves']['solution']) == 2 * 116
+    assert responses['cancelled']['status'] == 'cancelled'
+    assert responses['late']['status'] == 'timeout'
+    assert responses['none']['status'] == 'unsolvable'
+    assert responses['hint']['moves'] == 116 and len(responses['hint']['solution']) == 2
+    assert responses['limited']['status'] == 'limited' and responses['unlimited']['status'] == 'solved'
+    assert responses['larger']['moves'] == 44 and len(responses['larger']['solution']) == 2 * 44
+
+
+def test_anytime_weighted_astar_bounds_its_solutions():
+    hardest = hrd.encode_grid([list(row) for row in ["^222", "v^11", "^v11", "v<>2", "<>.."]])
+    for start in (hardest, hrd.encode_grid(load(5))):
+        optimal = len(hrd.search_bibfs(start)) - 1
+        path, bound = hrd.search_awastar(start)
+        assert_valid_solution(path, start)
+        assert (len(path) - 1, bound) == (optimal, 1.0)
+        stats = hrd.SearchStats()
+        path, bound = hrd.search_awastar(start, time_budget=0, stats=stats)
+        assert_valid_solution(path, start)
+        assert optimal <= len(path) - 1 <= bound * optimal and stats.suboptimality == bound
+    assert hrd.search_awastar(hrd.encode_grid(load(2))) == (None, None)
+    # An answer found within a time budget is not served to later runs.
+    cache = hrd_cache.SolutionCache()
+    start = hrd.encode_grid(load(6))
+    assert_valid_solution(cache.solve('awastar', start, time_budget=0), start)
+    with pytest.raises(KeyError):
+        cache.get('awastar', start)
+
+
+def test_anytime_weighted_astar_paths_are_legal_moves():
+    # Many of these boards are solved through states stored as their mirror image.
+    for start in sorted(reachable(hrd.encode_grid(load(7)), 3000))[1000::25]:
+        for time_budget in (None, 0):
+            path, _ = hrd.search_awastar(start, time_budget=time_budget)
+            if path is not None:
+                assert_valid_solution(path, start)
+
+
+def test_hash_distributed_astar_is_optimal():
+    for n in (5, 6):
+        start = hrd.encode_grid(load(n))
+        path = hrd_parallel.search_hdastar(start, workers=3, batch=256)
+        assert_valid_solution(path, start)
+        assert len(path) == len(hrd.search_bibfs(start))
+    assert hrd_parallel.search_hdastar(hrd.encode_grid(load(1)), workers=2) is None
+    owners = [hrd_parallel.owner(hrd.canonical_key(state), 3) for state in reachable(hrd.encode_grid(load(6)))]
+    assert min(owners.count(k) for k in range(3)) > len(owners) / 4
+
+
+def test_external_bfs_and_memory_budget(tmp_path):
+    for n in (1, 5, 6):
+        start = hrd.encode_grid(load(n))
+        expected = hrd.search_bibfs(start)
+        path = hrd_external.search_external(start, max_memory=1 << 17, directory=str(tmp_path))
+        if expected is None:
+            assert path is None
+        else:
+            assert_valid_solution(path, start)
+            assert len(path) == len(expected)
+    assert os.listdir(tmp_path) == []
+    # No process fits in one byte, so astar hands its states over at its first
+    # check and is finished on disk without expanding any of them again.
+    start = hrd.encode_grid(load(5))
+    stats = hrd.SearchStats()
+    path = hrd.solve('astar', start, max_memory=1, spill_directory=str(tmp_path), stats=stats)
+    assert_valid_solution(path, start)
+    assert len(path) == 117 and stats.expanded < 12018 + hrd_external.MEMORY_CHECK_EVERY
+    for start in sorted(reachable(hrd.encode_grid(load(6)), 3000))[::750]:
+        expected = hrd.search_bibfs(start)
+        for every in (1, 30):
+            stats = hrd.SearchStats(hook=lambda state, expanded: None, every=every)
+            path = hrd.solve('astar', start, max_memory=1, spill_directory=str(tmp_path), stats=stats)
+            assert_valid_solution(path, start)
+            assert len(path) == len(expected)
+    # Other searches start again from scratch.
+    stats = hrd.SearchStats()
+    path = hrd.solve('bibfs', start, max_memory=1, stats=stats)
+    assert [0, 0] in stats.f_progression and len(path) == len(expected)
+    assert os.listdir(tmp_path) == []
+    # The budget would not see the memory of hdastar's workers.
+    with pytest.raises(ValueError, match="worker processes"):
+        hrd.solve('hdastar', start, max_memory=1 << 30)
+    # Nor would finishing by BFS keep to a depth limit or a time budget.
+    with pytest.raises(ValueError, match="depth limit"):
+        hrd.solve('dfs', start, max_memory=1, depth_limit=10)
+    with pytest.raises(ValueError, match="time budget"):
+        hrd.solve('awastar', start, max_memory=1, time_budget=0)
+    assert 0 < hrd_external.current_memory()
+    assert hrd.parse_size('64M') == 64 << 20 and hrd.parse_size('1.5k') == 1536
+
+
+def test_validate_grid_and_corpus_round_trip(tmp_path):
+    for n in (1, 2, 5, 6, 7):
+        hrd.validate_grid(load(n))
+    for n in (3, 4):
+        with pytest.raises(ValueError):
+            hrd.validate_grid(load(n))
+    with pytest.raises(ValueError, match="no '>'"):
+        hrd.validate_grid([list(row) for row in ["^11^", "v11v", "^<.^", "v22v", "2..2"]])
+    filename = str(tmp_path / "boards.hrdc")
+    puzzles = [(n, load(n), None) for n in (1, 2, 5, 6, 7)]
+    assert hrd_corpus.convert(puzzles, filename) == 5
+    corpus = hrd_corpus.Corpus(filename)
+    assert len(corpus) == 5 and list(corpus) == [hrd.encode_grid(grid) for _, grid, _ in puzzles]
+    assert corpus.grid(-1) == load(7) and corpus[2] == hrd.encode_grid(load(5))
+    with pytest.raises(IndexError):
+        corpus[5]
+    corpus.close()
+    assert [grid for _, grid, _ in hrd_batch.load_puzzles(filename)] == [grid for _, grid, _ in puzzles]
+    with pytest.raises(ValueError, match="^3: "):
+        hrd_corpus.convert([(3, load(3), None)], filename)
+    # A puzzle failing validation leaves the corpus written before untouched.
+    with pytest.raises(ValueError, match="^3: "):
+        hrd_corpus.convert(puzzles + [(3, load(3), None)], filename)
+    assert [grid for _, grid, _ in hrd_batch.load_puzzles(filename)] == [grid for _, grid, _ in puzzles]
+    assert sorted(os.listdir(tmp_path)) == [os.path.basename(filename)]
+
+
+def test_dfs_depth_limit_and_iterative_deepening(tmp_path):
+    start = hrd.encode_grid(load(6))
+    stats = hrd.SearchStats()
+    path = hrd.search_dfs(start, depth_limit=100, stats=stats)
+    assert_valid_solution(path, start)
+    assert len(path) <= 101 and stats.peak_frontier <= 100
+    cache = hrd_cache.SolutionCache()
+    for _ in range(2):
+        with pytest.raises(hrd.DepthLimitReached):
+            cache.solve('dfs', start, depth_limit=70)
+    assert_valid_solution(cache.solve('dfs', start), start)
+    assert len(cache.solve('dfs', start, depth_limit=100)) <= 101
+    # Iterative deepening is not answered with the longer path plain dfs cached.
+    assert len(cache.solve('dfs', start, iterative=True)) == 78
+    assert len(cache.get('astar', start)) == 78
+    start = hrd.encode_grid(load(7))
+    assert len(hrd.search_dfs(start, iterative=True)) == 5
+    assert len(hrd.search_dfs(start, iterative=True, tt_size=1)) == 5
+    with pytest.raises(hrd.DepthLimitReached):
+        hrd.search_dfs(start, iterative=True, depth_limit=3)
+    assert hrd.search_dfs(hrd.encode_grid(load(1)), iterative=True) is None
+    assert hrd.search_dfs(hrd.encode_grid(load(1)), depth_limit=1000) is None
+    # Running into the limit leaves no stale solution behind and exits non-zero.
+    output = tmp_path / "solution.txt"
+    output.write_text("STALE")
+    result = subprocess.run([sys.executable, os.path.join(os.path.dirname(FIXTURES), "hrd.py"), "--inputfile",
+                             os.path.join(FIXTURES, "test-input-file-7"), "--outputfile", str(output), "--algo", "dfs",
+                             "--iterative-deepening", "--depth-limit", "3"], capture_output=True, text=True)
+    assert result.returncode == 1 and "within 3 moves" in result.stdout and output.read_text() == ""
+
+
+def test_macro_moves():
+    start = hrd.encode_grid(load(5))
+    for successor in hrd.get_macro_successors_packed(start):
+        assert start not in hrd.get_macro_successors_packed(successor, start)
+        assert start in hrd.get_macro_successors_packed(successor)
+    stats = hrd.SearchStats()
+    path = hrd.search_astar(start, macro=True, stats=stats)
+    assert len(path) == 82
+    slides = hrd.expand_macro_path(path)
+    assert_valid_solution(slides, start)
+    assert len(slides) == 119 and slides[::len(slides) - 1] == path[::len(path) - 1]
+    assert hrd.search_astar(hrd.encode_grid(load(1)), macro=True) is None
+    with pytest.raises(ValueError):
+        hrd.solve('bibfs', start, macro=True)
+    # Paths of piece moves and of slides are cached apart.
+    cache = hrd_cache.SolutionCache()
+    start = hrd.encode_grid(load(7))
+    assert cache.solve('astar', start, macro=True) == hrd.search_astar(start, macro=True)
+    assert_valid_solution(cache.solve('bibfs', start), start)
+    assert cache.get('astar', start, macro=True) == hrd.search_astar(start, macro=True)
+
+
+def test_hint_session_reuses_searches():
+    start = hrd.encode_grid(load(6))
+    stats = hrd.SearchStats()
+    session = hrd_hints.HintSession(stats=stats)
+    assert session.distance(start) == 77
+    first = stats.expanded
+    state = session.hint(start)
+    assert session.distance(state) == 76 and stats.expanded == first
+    # Step off the known path; the hints from there must still be optimal.
+    state = next(s for s in hrd.get_successors_packed(state) if session.distance(s) != 75)
+    moves = session.distance(state)
+    assert moves == len(hrd.search_bibfs(state)) - 1
+    while not hrd.is_goal_packed(state):
+        successor = session.hint(state)
+        assert successor in hrd.get_successors_packed(state)
+        state = successor
+        moves -= 1
+        assert session.distance(state) == moves
+    assert stats.expanded - first < first // 10
+    assert session.hint(state) is None
+    assert session.hint(hrd.encode_grid(load(1))) is None
+
+
+def test_larger_board_geometry(tmp_path):
+    filename = os.path.join(FIXTURES, "test-input-file-8")
+    grid, goal = hrd.read_puzzle(filename)
+    assert goal == (4, 1) and (len(grid[0]), len(grid)) == (5, 6)
+    assert hrd.parse_cell('4,1') == hrd.parse_cell('4 1') == goal
+    try:
+        hrd.set_geometry(5, 6, *goal)
+        hrd.validate_grid(grid)
+        start = hrd.encode_grid(grid)
+        assert hrd.STATE_BYTES == 12 and not hrd.SYMMETRIC and hrd.decode_state(start) == grid
+        path = hrd.solve('astar', start)
+        assert_valid_solution(path, start)
+        assert len(path) == 45
+        # Modules that pack states read the state width of the geometry in play.
+        cache = hrd_cache.SolutionCache(filename=str(tmp_path / "big.db"))
+        assert cache.solve('astar', start) == path
+        cache.close()
+        moves = str(tmp_path / "moves")
+        hrd_moves.write_moves(path, moves)
+        assert hrd_moves.read_geometry(moves) == (5, 6, 4, 1) and hrd_moves.read_moves(moves) == path
+        with pytest.raises(ValueError):
+            hrd.set_geometry(5, 6, 5, 1)
+    finally:
+        hrd.set_geometry(4, 5)
+    assert hrd.geometry() == (4, 5, 3, 1) and hrd.SYMMETRIC
+    with pytest.raises(ValueError):
+        hrd_moves.read_moves(moves)
+    # Tables, databases and cached solutions only serve the geometry they were made for.
+    start = hrd.encode_grid(load(6))
+    table_file = str(tmp_path / "hrd.table")
+    hrd_retro.write_table(table_file, hrd_retro.build_distances(start))
+    cache = hrd_cache.SolutionCache()
+    cache.solve('astar', start)
+    try:
+        hrd.set_geometry(4, 5, 0, 1)
+        with pytest.raises(ValueError, match=r"goal at \(3, 1\)"):
+            hrd.solve('retro', start, table_file=table_file)
+        with pytest.raises(KeyError):
+            cache.get('astar', start)
+    finally:
+        hrd.set_geometry(4, 5)
+    # Batch workers play on the geometry of each puzzle they are handed.
+    (puzzle_id, grid, goal), = hrd_batch.load_puzzles(filename)
+    assert goal == (4, 1)
+    try:
+        assert hrd_batch.solve_puzzle(puzzle_id, grid, 'astar', goal=goal)['moves'] == 44
+    finally:
+        hrd.set_geometry(4, 5)
+    board = hrd_starter.read_from_file(filename)
+    assert (board.width, board.height, board.goal_x, board.goal_y) == (5, 6, 1, 4)
+    malformed = tmp_path / "malformed.txt"
+    malformed.write_text("# goal 3\n" + hrd.display_grid(load(7)))
+    with pytest.raises(ValueError, match="ROW,COL"):
+        hrd_starter.read_from_file(str(malformed))
+    output = str(tmp_path / "solution.txt")
+    subprocess.run([sys.executable, os.path.join(os.path.dirname(FIXTURES), "hrd.py"), "--inputfile", filename,
+                    "--outputfile", output, "--algo", "astar", "--goal", "0,3"], check=True)
+    with open(output) as f:
+        boards = f.read().split('\n\n')
+    assert boards[-2].split('\n')[:2] == ["^2.11", "v2.11"]
+    result = subprocess.run([sys.executable, os.path.join(os.path.dirname(FIXTURES), "hrd.py"), "--inputfile",
+                             filename, "--outputfile", output, "--algo", "npbfs"], capture_output=True, text=True)
+    assert result.returncode == 2 and "npbfs" in result.stderr and "Traceback" not in result.stderr
+
+
+def test_starter_engine_moves_in_place():
+    board = hrd_starter.read_from_file(os.path.join(FIXTURES, "test-input-file-6"))
+    before = str(board)
+    for move in board.moves():
+        board.apply(move)
+        assert sorted(board.key()) == sorted(before.replace('\n', ''))
+        board.undo(move)
+        assert str(board) == before
+    for n, moves in ((5, 116), (6, 77), (7, 4)):
+        board = hrd_starter.read_from_file(os.path.join(FIXTURES, f"test-input-file-{n}"))
+        goal = hrd_starter.run_search('astar', board)
+        assert goal.depth == moves and hrd_starter.is_goal(goal.restore().grid)
+        goal = hrd_starter.run_search('dfs', board)
+        states = []
+        while goal is not None:
+            states.append(hrd.encode_grid([list(line) for line in str(goal.restore()).split()]))
+            goal = goal.parent
+        states.reverse()
+        assert all(b in hrd.get_successors_packed(a) for a, b in zip(states, states[1:]))
+        assert hrd.is_goal_packed(states[-1])
+    board = hrd_starter.read_from_file(os.path.join(FIXTURES, "test-input-file-1"))
+    assert hrd_starter.run_search('astar', board) is None